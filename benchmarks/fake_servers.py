@@ -0,0 +1,253 @@
+import hashlib
+import json
+import math
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+class _BackgroundServer:
+    """Запуск ThreadingHTTPServer в фоновом потоке на свободном порту"""
+
+    def __init__(self, handler_class, host='127.0.0.1', port=0):
+        self.httpd = ThreadingHTTPServer((host, port), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class CsvServer(_BackgroundServer):
+    """
+    Отдаёт CSV по адресу /schedule.csv как CSV_URL.
+
+    Поддерживает ETag/If-None-Match, чтобы проверять условные обновления.
+    Содержимое можно заменить через set_content(); latency задаёт задержку ответа.
+    """
+
+    def __init__(self, content, latency=0.0, **kwargs):
+        super().__init__(_CsvHandler, **kwargs)
+        self.latency = latency
+        self.requests = 0
+        self.set_content(content)
+
+    def set_content(self, content):
+        body = content.encode('utf-8') if isinstance(content, str) else content
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+
+    @property
+    def csv_url(self):
+        return self.url + '/schedule.csv'
+
+
+class _CsvHandler(_QuietHandler):
+    def do_GET(self):
+        server = self.server.owner
+        server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if self.headers.get('If-None-Match') == server.etag:
+            self._send(304, headers={'ETag': server.etag})
+        else:
+            self._send(200, server.body, 'text/csv; charset=utf-8', {'ETag': server.etag})
+
+
+class FakeTelegramServer(_BackgroundServer):
+    """
+    Заглушка Telegram Bot API: отвечает на /bot<token>/<method> как настоящий API.
+
+    Все вызовы записываются в calls; latency задаёт искусственную задержку ответа.
+    Если задан chat_interval, sendMessage в тот же чат чаще одного раза за
+    chat_interval секунд получает 429 с retry_after, как у настоящего API.
+    Обновления для getUpdates кладутся в очередь через push_update(), а после
+    setWebhook отправляются POST-запросом на адрес вебхука, как это делает Telegram.
+    """
+
+    def __init__(self, latency=0.0, chat_interval=0.0, **kwargs):
+        super().__init__(_TelegramHandler, **kwargs)
+        self.latency = latency
+        self.chat_interval = chat_interval
+        self.rate_limited = 0
+        self._last_sent = {}
+        self.calls = []
+        self.webhook_url = None
+        self.webhook_secret = None
+        self._updates = []
+        self._update_id = 0
+        self._message_id = 0
+        self._lock = threading.Lock()
+        self._has_updates = threading.Condition(self._lock)
+
+    def push_update(self, update):
+        """
+        Передаёт обновление боту, назначая ему update_id.
+
+        Без вебхука обновление ждёт в очереди getUpdates. С вебхуком оно сразу
+        отправляется POST-запросом и возвращается вместе с кодом ответа бота
+        и временем подтверждения в секундах.
+        """
+        with self._lock:
+            self._update_id += 1
+            update = dict(update, update_id=self._update_id)
+            webhook_url, secret = self.webhook_url, self.webhook_secret
+            if webhook_url is None:
+                self._updates.append(update)
+                self._has_updates.notify_all()
+                return update
+
+        request = urllib.request.Request(webhook_url, data=json.dumps(update).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        if secret:
+            request.add_header('X-Telegram-Bot-Api-Secret-Token', secret)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        return dict(update, webhook_status=status, webhook_ack_s=time.perf_counter() - started)
+
+    def sent_messages(self):
+        with self._lock:
+            return [params for method, params in self.calls if method == 'sendMessage']
+
+    def _handle(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            # Отклонённые с 429 сообщения в calls не попадают
+            if method != 'sendMessage':
+                self.calls.append((method, params))
+            if method == 'getMe':
+                return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+            if method == 'setWebhook':
+                self.webhook_url = params.get('url') or None
+                self.webhook_secret = params.get('secret_token') or None
+                return True
+            if method == 'deleteWebhook':
+                self.webhook_url = self.webhook_secret = None
+                return True
+            if method == 'getUpdates':
+                if self.webhook_url is not None:
+                    raise _ApiError(409, "Conflict: can't use getUpdates method while webhook is active")
+                offset = int(params.get('offset') or 0)
+                self._updates = [u for u in self._updates if u['update_id'] >= offset]
+                if not self._updates:
+                    self._has_updates.wait(min(float(params.get('timeout') or 0), 1.0))
+                return list(self._updates)
+            if method == 'sendMessage':
+                chat_id = int(params.get('chat_id', 0))
+                now = time.monotonic()
+                wait = self._last_sent.get(chat_id, float('-inf')) + self.chat_interval - now
+                if wait > 0:
+                    self.rate_limited += 1
+                    raise _ApiError(429, f"Too Many Requests: retry after {math.ceil(wait)}",
+                                    {'retry_after': math.ceil(wait)})
+                self._last_sent[chat_id] = now
+                self.calls.append((method, params))
+                self._message_id += 1
+                return {
+                    'message_id': self._message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                    'text': params.get('text', '')
+                }
+            return True
+
+
+class _ApiError(Exception):
+    def __init__(self, code, description, parameters=None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.parameters = parameters
+
+
+class _TelegramHandler(_QuietHandler):
+    def _dispatch(self, params):
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if len(parts) != 2 or not parts[0].startswith('bot'):
+            self._send(404, b'{"ok": false, "error_code": 404, "description": "Not Found"}')
+            return
+        try:
+            result = self.server.owner._handle(parts[1], params)
+        except _ApiError as e:
+            body = {'ok': False, 'error_code': e.code, 'description': e.description}
+            if e.parameters:
+                body['parameters'] = e.parameters
+            self._send(e.code, json.dumps(body).encode('utf-8'))
+            return
+        self._send(200, json.dumps({'ok': True, 'result': result}).encode('utf-8'))
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        self._dispatch({key: values[-1] for key, values in query.items()})
+
+    def do_POST(self):
+        # pyTelegramBotAPI передаёт параметры в строке запроса даже для POST
+        params = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            params.update(json.loads(body or '{}'))
+        elif body:
+            params.update({key: values[-1] for key, values in parse_qs(body).items()})
+        self._dispatch(params)
+
+
+def make_message_update(text, user_id, username, update_id=None):
+    """Обновление Telegram с текстовым сообщением от пользователя в личном чате"""
+    update = {
+        'message': {
+            'message_id': user_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'username': username},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': username, 'username': username},
+            'text': text
+        }
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        update['message']['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    if update_id is not None:
+        update['update_id'] = update_id
+    return update
@@ -0,0 +1,100 @@
+import argparse
+import csv
+import io
+import json
+import random
+from datetime import date, timedelta
+
+MONTHS = ['января', 'февраля', 'марта', 'апреля', 'мая', 'июня',
+          'июля', 'августа', 'сентября', 'октября', 'ноября', 'декабря']
+WEEKDAYS = ['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс']
+
+# Дневной интервал и ночная смена, переходящая на следующие сутки
+DEFAULT_INTERVALS = ['09:00-21:00', '21:00-09:00']
+
+
+def employee_names(count):
+    """Имена сотрудников для заголовка и соответствующие им никнеймы Telegram"""
+    names = [f"Сотрудник {i + 1:04d}" for i in range(count)]
+    usernames = [f"@user{i + 1:04d}" for i in range(count)]
+    return names, usernames
+
+
+def head_mapping(employees):
+    """HEAD_MAPPING для сгенерированной таблицы"""
+    names, usernames = employee_names(employees)
+    mapping = {'Дата': 'Date', 'Время': 'Time'}
+    mapping.update(zip(names, usernames))
+    return mapping
+
+
+def generate_schedule_csv(employees=20, days=31, intervals=None, start=None,
+                          duty_per_interval=1, vacation_blocks=2, seed=0):
+    """
+    Генерирует CSV расписания в формате рабочей таблицы.
+
+    Первая колонка — дата вида «пн, 1 октября», заполненная только в первой
+    строке дня, вторая — интервал, далее по колонке на сотрудника со статусами
+    р/в/о/+. В конце добавляется пустая колонка, как в выгрузке Google Sheets.
+
+    :param employees: количество сотрудников
+    :param days: количество дней
+    :param intervals: интервалы внутри дня (по умолчанию дневная и ночная смены)
+    :param start: первая дата (по умолчанию первое число текущего месяца)
+    :param duty_per_interval: сколько сотрудников дежурят в каждом интервале
+    :param vacation_blocks: сколько блоков отпуска (по 7-14 дней) на сотрудника
+    :return: текст CSV
+    """
+    rng = random.Random(seed)
+    intervals = intervals or DEFAULT_INTERVALS
+    start = start or date.today().replace(day=1)
+    names, _ = employee_names(employees)
+
+    # Отпуска: непрерывные блоки дней
+    vacations = [set() for _ in range(employees)]
+    for days_off in vacations:
+        for _ in range(vacation_blocks):
+            if rng.random() < 0.3:
+                first = rng.randrange(days)
+                days_off.update(range(first, min(days, first + rng.randint(7, 14))))
+
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(['Дата', 'Время'] + names + [''])
+
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        date_cell = f"{WEEKDAYS[day.weekday()]}, {day.day} {MONTHS[day.month - 1]}"
+        base = ['о' if offset in vacations[i] else ('в' if (i + offset) % 7 in (5, 6) else 'р')
+                for i in range(employees)]
+        available = [i for i in range(employees) if base[i] != 'о']
+        for n, interval in enumerate(intervals):
+            statuses = list(base)
+            for i in rng.sample(available, min(duty_per_interval, len(available))):
+                statuses[i] = '+'
+            writer.writerow([date_cell if n == 0 else '', interval] + statuses + [''])
+
+    return out.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор синтетического расписания")
+    parser.add_argument('--employees', type=int, default=20)
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--intervals', nargs='*', default=DEFAULT_INTERVALS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='schedule.csv')
+    parser.add_argument('--mapping-output', help="куда сохранить HEAD_MAPPING в JSON")
+    args = parser.parse_args()
+
+    content = generate_schedule_csv(args.employees, args.days, args.intervals, seed=args.seed)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(content)
+    if args.mapping_output:
+        with open(args.mapping_output, 'w', encoding='utf-8') as f:
+            json.dump(head_mapping(args.employees), f, ensure_ascii=False)
+    print(f"Расписание сохранено в '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
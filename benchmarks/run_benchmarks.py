@@ -0,0 +1,376 @@
+"""
+Офлайн-бенчмарк загрузки расписания и обработчиков бота.
+
+Генерирует синтетическую таблицу, отдаёт её локальным HTTP-сервером как
+CSV_URL, направляет бота на заглушку Telegram Bot API и замеряет:
+- время и пиковую память загрузки в хранилище (download_and_process_sources),
+  обычной и потоковой;
+- время повторной загрузки без изменений и загрузки изменённой таблицы
+  (с поячеечным сравнением снимков);
+- p50/p99 задержки «Кто дежурит?» и «Моё расписание» при параллельных пользователях;
+- рассылку напоминаний: всплеск сообщений через очередь рассылки при лимите
+  Bot API 1 сообщение в секунду на чат, время до отправки всех сообщений,
+  число ответов 429 и задержка «Кто дежурит?» во время всплеска;
+- режим вебхука: заглушка Bot API отправляет обновления POST-запросами во
+  встроенный HTTP-сервер бота, замеряются время подтверждения и время, за
+  которое бот ответил на все обновления.
+
+Результат пишется в JSON для сравнения между релизами:
+
+    python -m benchmarks.run_benchmarks --employees 200 --days 62 --users 32 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_servers import CsvServer, FakeTelegramServer, make_message_update  # noqa: E402
+from benchmarks.generate_schedule import employee_names, generate_schedule_csv, head_mapping  # noqa: E402
+
+
+def percentile(values, fraction):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def latency_summary(samples):
+    """Сводка задержек в миллисекундах"""
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+def _timed_ingest(sources, store_dir, streaming=False, trace=False):
+    """Загрузка таблиц в хранилище: (обновлённые разделы, время, пиковая память или None)"""
+    from schedule_to_sql import download_and_process_sources
+
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    updated = download_and_process_sources(sources, store_dir, streaming=streaming)
+    wall = time.perf_counter() - started
+    peak = None
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return updated, wall, peak
+
+
+def measure_ingest(csv_server, store_dir, changed_content):
+    """
+    Время и пиковая память полной загрузки в хранилище (обычной и потоковой),
+    затем время загрузки без изменений и загрузки таблицы changed_content;
+    время построения индекса из разделов
+    """
+    from schedule_index import ScheduleIndex
+    from schedule_snapshot import snapshot_path
+    from schedule_store import ScheduleSource
+
+    sources = [ScheduleSource('bench', csv_server.csv_url)]
+    written, wall, peak = _timed_ingest(sources, store_dir, trace=True)
+    _, streaming_wall, streaming_peak = _timed_ingest(sources, f"{store_dir}-streaming", streaming=True, trace=True)
+    noop_written, noop_wall, _ = _timed_ingest(sources, store_dir)
+
+    csv_server.set_content(changed_content)
+    _, changed_wall, _ = _timed_ingest(sources, store_dir)
+
+    started = time.perf_counter()
+    ScheduleIndex.from_partitions(written)
+    index_wall = time.perf_counter() - started
+
+    return {
+        'wall_s': round(wall, 4),
+        'peak_memory_bytes': peak,
+        'streaming_wall_s': round(streaming_wall, 4),
+        'streaming_peak_memory_bytes': streaming_peak,
+        'partitions': len(written),
+        'noop_wall_s': round(noop_wall, 4),
+        'noop_changed': bool(noop_written),
+        'changed_wall_s': round(changed_wall, 4),
+        'db_size_bytes': sum(os.path.getsize(db_path) for db_path in written),
+        'snapshot_size_bytes': sum(os.path.getsize(snapshot_path(db_path)) for db_path in written),
+        'index_from_partitions_s': round(index_wall, 4),
+    }
+
+
+def measure_sources(teams, employees, days, latency, seed):
+    """
+    Загрузка нескольких таблиц с задержкой latency у каждой: время параллельной
+    загрузки в хранилище по сравнению с суммой последовательных загрузок
+    """
+    from schedule_store import ScheduleSource
+    from schedule_to_sql import download_and_process_sources
+
+    contents = [generate_schedule_csv(employees, days, seed=seed + n) for n in range(teams)]
+    servers = [CsvServer(content, latency=latency).start() for content in contents]
+    try:
+        sources = [ScheduleSource(f"team{n}", server.csv_url) for n, server in enumerate(servers)]
+
+        started = time.perf_counter()
+        for source in sources:
+            download_and_process_sources([source], 'sequential-store')
+        sequential = time.perf_counter() - started
+
+        started = time.perf_counter()
+        updated = download_and_process_sources(sources, 'sources-store')
+        parallel = time.perf_counter() - started
+
+        started = time.perf_counter()
+        download_and_process_sources(sources, 'sources-store')
+        noop = time.perf_counter() - started
+    finally:
+        for server in servers:
+            server.stop()
+
+    return {
+        'teams': teams,
+        'latency_s': latency,
+        'sequential_wall_s': round(sequential, 4),
+        'parallel_wall_s': round(parallel, 4),
+        'noop_wall_s': round(noop, 4),
+        'partitions_written': len(updated),
+    }
+
+
+def measure_handler(handler, messages, users):
+    """Запускает handler для всех сообщений в users параллельных потоках и возвращает задержки"""
+
+    def call(message):
+        started = time.perf_counter()
+        handler(message)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        return list(pool.map(call, messages))
+
+
+def measure_api(base_url, paths, token, requests, users):
+    """
+    Опрос HTTP API расписания: полные ответы и повторные запросы с If-None-Match.
+
+    :return: задержки ответов 200 и 304 и доля ответов 304 при повторном опросе
+    """
+    authorization = {'Authorization': f"Bearer {token}"}
+    etags = {}
+    for path in paths:
+        with urllib.request.urlopen(urllib.request.Request(base_url + path, headers=authorization)) as response:
+            etags[path] = response.headers['ETag']
+
+    def call(n, revalidate):
+        path = paths[n % len(paths)]
+        headers = dict(authorization, **({'If-None-Match': etags[path]} if revalidate else {}))
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(base_url + path, headers=headers)) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        full = list(pool.map(lambda n: call(n, False), range(requests)))
+        revalidated = list(pool.map(lambda n: call(n, True), range(requests)))
+
+    return {
+        'full': latency_summary([elapsed for elapsed, _ in full]),
+        'revalidated': latency_summary([elapsed for elapsed, _ in revalidated]),
+        'not_modified_ratio': round(sum(1 for _, status in revalidated if status == 304) / requests, 4),
+    }
+
+
+def measure_webhook(telegram, updates, users, timeout=60.0):
+    """
+    Отправляет обновления на вебхук бота в users параллельных потоках.
+
+    Каждое обновление «Кто дежурит?» порождает одно sendMessage, поэтому
+    обработка считается завершённой, когда заглушка получила столько же ответов.
+    """
+    expected = len(telegram.sent_messages()) + len(updates)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        delivered = list(pool.map(telegram.push_update, updates))
+    acked = time.perf_counter() - started
+
+    while len(telegram.sent_messages()) < expected and time.perf_counter() - started < timeout:
+        time.sleep(0.005)
+    drained = time.perf_counter() - started
+
+    return {
+        'ack': latency_summary([update['webhook_ack_s'] for update in delivered]),
+        'rejected': sum(1 for update in delivered if update['webhook_status'] != 200),
+        'all_acked_s': round(acked, 4),
+        'all_replied_s': round(drained, 4),
+        'replied': len(telegram.sent_messages()) - expected + len(updates),
+    }
+
+
+def measure_burst(bot, telegram, chats, per_chat, handler_messages, users, timeout=120.0):
+    """
+    Всплеск напоминаний: per_chat сообщений в каждый из chats чатов через
+    очередь рассылки бота, параллельно с обработкой handler_messages.
+    """
+    telegram.chat_interval = 1.0
+    limited_before = telegram.rate_limited
+    bot.outbound.start()
+    try:
+        started = time.perf_counter()
+        for n in range(per_chat):
+            for chat_id in range(200000, 200000 + chats):
+                bot.outbound.put(chat_id, f"Напоминание {n + 1}")
+        enqueued = time.perf_counter() - started
+
+        latencies = measure_handler(bot.who_is_on_duty, handler_messages, users)
+        drained = bot.outbound.join(timeout)
+        drain_wall = time.perf_counter() - started
+    finally:
+        telegram.chat_interval = 0.0
+
+    return {
+        'messages': chats * per_chat,
+        'enqueue_ms': round(enqueued * 1000, 3),
+        'drained': drained,
+        'drain_s': round(drain_wall, 4),
+        'rate_limited': telegram.rate_limited - limited_before,
+        'who_is_on_duty_during_burst': latency_summary(latencies),
+    }
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='duty-bench-')
+    os.chdir(workdir)
+
+    content = generate_schedule_csv(args.employees, args.days, start=date.today().replace(day=1), seed=args.seed)
+    _, usernames = employee_names(args.employees)
+
+    with CsvServer(content) as csv_server, FakeTelegramServer(latency=args.telegram_latency) as telegram:
+        os.environ.update({
+            'CSV_URL': csv_server.csv_url,
+            'HEAD_MAPPING': json.dumps(head_mapping(args.employees), ensure_ascii=False),
+            'TELEGRAM_BOT_TOKEN': '123456:bench',
+            'TELEGRAM_API_URL': telegram.url,
+            'REFRESH_INTERVAL_MINUTES': '0',
+            'SCHEDULE_API_TOKEN': 'bench',
+        })
+
+        changed_content = generate_schedule_csv(args.employees, args.days, start=date.today().replace(day=1),
+                                                seed=args.seed + 1)
+        ingest = measure_ingest(csv_server, os.path.join(workdir, 'ingest-store'), changed_content)
+        sources = measure_sources(args.teams, args.employees, args.days, args.sheet_latency, args.seed)
+
+        # Хранилище, из которого бот строит индекс
+        from schedule_store import ScheduleSource
+        from schedule_to_sql import STORE_DIR, download_and_process_sources
+        download_and_process_sources([ScheduleSource('default', csv_server.csv_url)], STORE_DIR)
+
+        # Встроенный HTTP-сервер бота на свободном порту принимает вебхук
+        from http_server import start_http_server
+        httpd = start_http_server(0, host='127.0.0.1')
+        os.environ['WEBHOOK_URL'] = f"http://127.0.0.1:{httpd.server_address[1]}/telegram/webhook"
+
+        import telebot
+        import bot
+
+        def message(text, n):
+            username = usernames[n % len(usernames)].lstrip('@')
+            return telebot.types.Message.de_json(make_message_update(text, 1000 + n, username)['message'])
+
+        duty_messages = [message("Кто дежурит?", n) for n in range(args.requests)]
+        schedule_inputs = ["На завтра", "3️⃣", "7️⃣", "Покажи весь месяц"]
+        schedule_messages = [message(schedule_inputs[n % len(schedule_inputs)], n) for n in range(args.requests)]
+
+        # Прогрев: построение индекса и кеша строк
+        bot.who_is_on_duty(duty_messages[0])
+        bot.handle_schedule_days_input(schedule_messages[0])
+
+        handlers = {
+            'who_is_on_duty': latency_summary(measure_handler(bot.who_is_on_duty, duty_messages, args.users)),
+            'handle_schedule_days_input': latency_summary(
+                measure_handler(bot.handle_schedule_days_input, schedule_messages, args.users)
+            ),
+        }
+
+        burst_messages = [message("Кто дежурит?", 50000 + n) for n in range(args.requests)]
+        burst = measure_burst(bot, telegram, args.burst_chats, args.burst_per_chat, burst_messages, args.users)
+
+        bot.start_webhook()
+        webhook_updates = [make_message_update("Кто дежурит?", 1000 + n, usernames[n % len(usernames)].lstrip('@'))
+                           for n in range(args.requests)]
+        webhook = measure_webhook(telegram, webhook_updates, args.users)
+
+        today = date.today()
+        api_paths = ['/api/duty/now', f"/api/duty?at={today}T12:00"]
+        api_paths += [f"/api/employees/{name.lstrip('@')}{suffix}?from={today.replace(day=1)}"
+                      for name in usernames[:4] for suffix in ('', '.ics')]
+        api = measure_api(f"http://127.0.0.1:{httpd.server_address[1]}", api_paths, os.environ['SCHEDULE_API_TOKEN'],
+                          args.requests, args.users)
+        httpd.shutdown()
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'params': {
+            'employees': args.employees,
+            'days': args.days,
+            'users': args.users,
+            'requests': args.requests,
+            'telegram_latency_s': args.telegram_latency,
+            'seed': args.seed,
+            'burst_chats': args.burst_chats,
+            'burst_per_chat': args.burst_per_chat,
+            'teams': args.teams,
+            'sheet_latency_s': args.sheet_latency,
+        },
+        'ingest': ingest,
+        'sources': sources,
+        'handlers': handlers,
+        'burst': burst,
+        'webhook': webhook,
+        'api': api,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк бота дежурств")
+    parser.add_argument('--employees', type=int, default=50)
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--users', type=int, default=16, help="параллельных пользователей")
+    parser.add_argument('--requests', type=int, default=500, help="запросов на каждый обработчик")
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="задержка заглушки Bot API, секунды")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--burst-chats', type=int, default=60, help="чатов во всплеске напоминаний")
+    parser.add_argument('--burst-per-chat', type=int, default=3, help="сообщений на чат во всплеске")
+    parser.add_argument('--teams', type=int, default=4, help="таблиц команд при загрузке нескольких таблиц")
+    parser.add_argument('--sheet-latency', type=float, default=0.2, help="задержка ответа каждой таблицы, секунды")
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    results = run(args)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    print(f"Результаты сохранены в '{output}'.")
+
+
+if __name__ == '__main__':
+    main()
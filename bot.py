@@ -1,140 +1,324 @@
-import subprocess
 import telebot
-import sqlite3
-from datetime import datetime, timedelta
+from datetime import date, datetime, time as day_time, timedelta
 from dotenv import load_dotenv
 import os
+import time
+import hmac
+import secrets
+import json
 import logging
+import functools
+import threading
+from urllib.parse import urlparse
+from conversation_store import create_conversation_store
+from http_server import route, start_http_server
+from notifications import ChatRegistry, notify_changes
+from outbound import MAX_MESSAGE_LENGTH, OutboundQueue
+from reminders import ReminderScheduler
+from schedule_api import ScheduleApi
+from metrics import Gauge, HANDLER_DURATION, HANDLER_ERRORS, TELEGRAM_API_DURATION, WEBHOOK_UPDATES
+from structured_logging import current_context, log_context, setup_logging
+from schedule_diff import read_changes
+from schedule_index import get_schedule_index, reload_schedule_index
+from schedule_refresher import ScheduleRefresher
+from schedule_render import ScheduleRenderCache
+from schedule_store import load_sources
 
 # Загрузка переменных окружения
 load_dotenv()
 
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+CSV_URL = os.getenv('CSV_URL')
+
+# Таблицы команд: JSON-список {"team": "...", "url": "..."} или {"team": "...", "path": "..."};
+# без SCHEDULE_SOURCES используется одна таблица CSV_URL
+SCHEDULE_SOURCES = load_sources(os.getenv('SCHEDULE_SOURCES'), CSV_URL)
+
+# Каталог хранилища расписания, разбитого по командам и месяцам
+STORE_DIR = os.getenv('SCHEDULE_STORE', './schedule_store')
+
+# База прежних версий бота с одной таблицей; при первом запуске переносится в пустое хранилище
+LEGACY_DB_PATH = './schedule.db'
+
+# Период автоматического обновления расписания в минутах (0 — только по /update195)
+REFRESH_INTERVAL_MINUTES = float(os.getenv('REFRESH_INTERVAL_MINUTES', '60'))
+
+# Количество потоков, параллельно обрабатывающих сообщения
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '8'))
+
+# Альтернативный адрес Bot API (локальный сервер, заглушка для бенчмарков)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# Порт встроенного HTTP-сервера (метрики Prometheus на /metrics)
+HTTP_PORT = int(os.getenv('HTTP_PORT', '5000'))
+
+# Публичный адрес вебхука, например https://bot.example.com/telegram/webhook.
+# Telegram ходит только по HTTPS на порты 443/80/88/8443, поэтому снаружи нужен
+# прокси, передающий запросы на HTTP_PORT. Без WEBHOOK_URL бот работает через long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = (urlparse(WEBHOOK_URL).path or '/') if WEBHOOK_URL else None
+
+# Секрет, который Telegram передаёт в заголовке X-Telegram-Bot-Api-Secret-Token. Без него
+# любой, кто достучится до HTTP_PORT, мог бы прислать поддельное обновление, поэтому, если
+# WEBHOOK_SECRET не задан, секрет генерируется при запуске и передаётся в set_webhook
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+
+# Состояние диалогов: время жизни, лимит записей и файл SQLite, чтобы пережить перезапуск (пусто — в памяти)
+CONVERSATION_TTL_MINUTES = float(os.getenv('CONVERSATION_TTL_MINUTES', '15'))
+CONVERSATION_MAX_ENTRIES = int(os.getenv('CONVERSATION_MAX_ENTRIES', '10000'))
+CONVERSATION_DB = os.getenv('CONVERSATION_DB')
+
+# HTTP API расписания для внутренних сервисов (/api/duty/now, /api/duty, /api/employees/...)
+# и токен, который они передают в Authorization: Bearer. API слушает тот же порт, что и
+# вебхук, поэтому без токена не регистрируется
+SCHEDULE_API = os.getenv('SCHEDULE_API', '1').lower() in ('1', 'true', 'yes')
+SCHEDULE_API_TOKEN = os.getenv('SCHEDULE_API_TOKEN')
+
+# Уведомления об изменениях расписания и файл с соответствием никнейм -> чат
+NOTIFY_CHANGES = os.getenv('NOTIFY_CHANGES', '1').lower() in ('1', 'true', 'yes')
+CHATS_DB = os.getenv('CHATS_DB', './chats.db')
+
+# Самый длинный период в «Моё расписание», дней
+MAX_SCHEDULE_DAYS = 62
+
+# Напоминания: за сколько минут до дежурства и во сколько вечером присылать статус на завтра
+REMINDERS = os.getenv('REMINDERS', '1').lower() in ('1', 'true', 'yes')
+REMINDER_LEAD_MINUTES = float(os.getenv('REMINDER_LEAD_MINUTES', '60'))
+EVENING_REMINDER_TIME = day_time.fromisoformat(os.getenv('EVENING_REMINDER_TIME', '20:00'))
 
 if not TELEGRAM_BOT_TOKEN:
     print("TELEGRAM_BOT_TOKEN не найден в файле .env!")
     exit()
 
-# Инициализация логирования
-LOG_DIR = './logs'
-os.makedirs(LOG_DIR, exist_ok=True)
-log_file = os.path.join(LOG_DIR, f"{datetime.now().strftime('%d-%m-%Y')}.log")
-logging.basicConfig(
-    filename=log_file,
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    encoding='utf-8'
+# Инициализация логирования: JSON-записи через очередь, ротация в полночь со сжатием
+LOG_DIR = os.getenv('LOG_DIR', './logs')
+LOG_RETENTION_DAYS = int(os.getenv('LOG_RETENTION_DAYS', '30'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+setup_logging(LOG_DIR, retention_days=LOG_RETENTION_DAYS, level=LOG_LEVEL)
+
+# Инициализация бота: обработчики выполняются в пуле из BOT_WORKERS потоков,
+# поэтому медленный send_message одного пользователя не задерживает остальных
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL.rstrip('/') + '/bot{0}/{1}'
+bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN, threaded=True, num_threads=BOT_WORKERS)
+
+# Замер длительности вызовов Bot API
+_make_request = telebot.apihelper._make_request
+
+def _timed_make_request(token, method_name, *args, **kwargs):
+    with TELEGRAM_API_DURATION.time(method=method_name):
+        return _make_request(token, method_name, *args, **kwargs)
+
+telebot.apihelper._make_request = _timed_make_request
+
+
+def instrumented(handler_name):
+    """
+    Замер длительности обработчика и итоговая запись лога с обработчиком,
+    пользователем, задержкой и результатом. Все записи внутри обработчика
+    получают поля handler и user; необработанные исключения считаются ошибками.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(message):
+            user = message.from_user
+            if user.username and message.chat.type == 'private':
+                chat_registry.remember(user.username, message.chat.id)
+            with log_context(handler=handler_name, user=f"@{user.username}" if user.username else None,
+                             user_id=user.id, outcome='ok'):
+                started = time.perf_counter()
+                try:
+                    return func(message)
+                except Exception:
+                    handler_failed(handler_name)
+                    raise
+                finally:
+                    latency = time.perf_counter() - started
+                    HANDLER_DURATION.observe(latency, handler=handler_name)
+                    logging.info("Handler finished", extra={'latency_ms': round(latency * 1000, 3)})
+        return wrapper
+    return decorator
+
+
+def handler_failed(handler_name):
+    """Учитывает ошибку обработчика в метриках и в итоговой записи лога"""
+    HANDLER_ERRORS.inc(handler=handler_name)
+    current_context()['outcome'] = 'error'
+
+def refresh_schedule():
+    """Скачивает таблицы команд и пересобирает изменившиеся разделы хранилища в процессе бота"""
+    from schedule_to_sql import download_and_process_sources
+    return download_and_process_sources(SCHEDULE_SOURCES, STORE_DIR)
+
+
+# Личные чаты пользователей и очередь исходящих сообщений с лимитами Telegram
+chat_registry = ChatRegistry(CHATS_DB)
+outbound = OutboundQueue(bot.send_message)
+
+# Напоминания о сменах; очередь перестраивается после каждого обновления расписания
+reminders = ReminderScheduler(
+    outbound,
+    chat_registry,
+    lead=timedelta(minutes=REMINDER_LEAD_MINUTES),
+    evening=EVENING_REMINDER_TIME
 )
 
-# Инициализация бота
-bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
 
-# Путь к базе данных SQLite
-DB_PATH = './schedule.db'
+def on_schedule_refreshed(partitions):
+    """
+    Подменяет индекс, сообщает сотрудникам об изменениях в их сменах и перестраивает напоминания.
+
+    :param partitions: пути к базам обновлённых разделов
+    """
+    schedule_index = reload_schedule_index(STORE_DIR)
+    if NOTIFY_CHANGES:
+        changes = [change for db_path in partitions for change in read_changes(db_path)]
+        notify_changes(changes, chat_registry, outbound, date.today())
+    if REMINDERS:
+        reminders.rebuild(schedule_index)
+
+
+# Фоновое обновление расписания; после изменения данных индекс подменяется
+schedule_refresher = ScheduleRefresher(
+    refresh_schedule,
+    interval=REFRESH_INTERVAL_MINUTES * 60,
+    on_refreshed=on_schedule_refreshed
+)
+
+# Контексты пользователей: ограничены по времени жизни и количеству
+user_context = create_conversation_store(
+    CONVERSATION_DB,
+    ttl=CONVERSATION_TTL_MINUTES * 60,
+    max_entries=CONVERSATION_MAX_ENTRIES
+)
 
-# Глобальный словарь для хранения контекстов пользователей
-user_context = {}
+# Кеш отрендеренных строк расписания
+render_cache = ScheduleRenderCache()
 
-# Словарь статусов с переводами и эмодзи
-STATUS_MAPPING = {
-    'work': 'Рабочий день 👨🏻‍💻',
-    'dayoff': 'Выходной 🌴',
-    'vacation': 'Отпуск ✈️',
-    'duty': 'Дежурный 🚨'
-}
 
-# Экранирование для MarkdownV2
-SPECIAL_CHARS = r"_\*\[\]\(\)~`>#+\-=|{}\."
+def schedule_data_age():
+    """Возраст загруженных данных: манифест хранилища перезаписывается только при обновлении таблиц"""
+    signature = get_schedule_index(STORE_DIR).signature
+    if signature is None:
+        return None
+    return time.time() - signature[2] / 1e9
 
-def escape_markdown(text):
-    """Экранирование специальных символов для MarkdownV2"""
-    import re
-    return re.sub(f'([{SPECIAL_CHARS}])', r'\\\1', text)
 
-def get_weekday(date_str):
-    """Возвращает день недели для даты в формате DD.MM.YYYY"""
-    weekdays = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-    date_obj = datetime.strptime(date_str, '%d.%m.%Y')
-    return weekdays[date_obj.weekday()]
+SCHEDULE_DATA_AGE = Gauge('schedule_data_age_seconds', 'Возраст загруженных данных расписания', func=schedule_data_age)
+CONVERSATIONS = Gauge('bot_conversations', 'Незавершённые диалоги с пользователями', func=lambda: len(user_context))
+OUTBOUND_PENDING = Gauge('bot_outbound_pending', 'Сообщения в очереди рассылки', func=outbound.pending)
+REMINDERS_PENDING = Gauge('bot_reminders_pending', 'Запланированные напоминания', func=reminders.pending)
+
+
+def receive_update(request):
+    """
+    Приём обновления от Telegram по вебхуку.
+
+    Обработчики выполняются в пуле потоков бота, поэтому ответ 200 уходит сразу
+    после разбора обновления, не дожидаясь запросов к базе и send_message.
+    """
+    # Байты, а не строки: compare_digest отвергает str с не-ASCII символами исключением
+    supplied = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '').encode('utf-8')
+    if not hmac.compare_digest(supplied, WEBHOOK_SECRET.encode('utf-8')):
+        WEBHOOK_UPDATES.inc(result='forbidden')
+        return 403, {'Content-Type': 'text/plain; charset=utf-8'}, b'Forbidden'
+
+    try:
+        length = int(request.headers.get('Content-Length') or 0)
+        if length < 0:
+            raise ValueError(f"Content-Length {length}")
+        update = telebot.types.Update.de_json(json.loads(request.rfile.read(length).decode('utf-8')))
+    except (ValueError, KeyError, TypeError) as e:
+        # Тело могло остаться непрочитанным, поэтому соединение не переиспользуется
+        request.close_connection = True
+        WEBHOOK_UPDATES.inc(result='invalid')
+        logging.error(f"Webhook - Invalid update: {e}")
+        return 400, {'Content-Type': 'text/plain; charset=utf-8'}, b'Bad Request'
+
+    bot.process_new_updates([update])
+    WEBHOOK_UPDATES.inc(result='accepted')
+    return 200, {'Content-Type': 'text/plain; charset=utf-8'}, b'OK'
+
+
+if WEBHOOK_URL:
+    route('POST', WEBHOOK_PATH)(receive_update)
+
+if SCHEDULE_API and SCHEDULE_API_TOKEN:
+    ScheduleApi(lambda: get_schedule_index(STORE_DIR), token=SCHEDULE_API_TOKEN).register()
+elif SCHEDULE_API:
+    logging.warning("SCHEDULE_API_TOKEN не задан, HTTP API расписания отключено")
+
+
+def start_webhook():
+    """Регистрирует вебхук в Telegram; при ошибке возвращает False, и бот переходит на long polling"""
+    try:
+        bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, max_connections=BOT_WORKERS)
+    except Exception as e:
+        logging.error(f"Webhook registration failed, falling back to polling: {e}")
+        return False
+    logging.info(f"Webhook registered at {WEBHOOK_PATH}")
+    return True
 
 # Обработка команды /start
 @bot.message_handler(commands=['start'])
+@instrumented('send_welcome')
 def send_welcome(message):
     user_info = f"User: {message.from_user.first_name} (@{message.from_user.username or 'No username'})"
     logging.info(f"{user_info} sent /start")
     markup = telebot.types.ReplyKeyboardMarkup(resize_keyboard=True)
     button_duty = telebot.types.KeyboardButton("Кто дежурит?")
     button_schedule = telebot.types.KeyboardButton("Моё расписание")
-    markup.add(button_duty, button_schedule)
+    button_next = telebot.types.KeyboardButton("Кто следующий?")
+    markup.add(button_duty, button_schedule, button_next)
     bot.send_message(message.chat.id, "Привет! Теперь я Матроскин_V2.5 и я пересобираюсь в докере после пуша в мастер:", reply_markup=markup)
 
 # Обработка команды /update195 (обновить таблицу расписания)
 @bot.message_handler(commands=['update195'])
+@instrumented('update_195')
 def update_195(message):
     user_info = f"User: {message.from_user.first_name} (@{message.from_user.username or 'No username'})"
     logging.info(f"{user_info} sent /update195")
+    chat_id = message.chat.id
+
+    def on_done(changed, error):
+        if error is not None:
+            bot.send_message(chat_id, f"Ошибка при обновлении расписания: {error}")
+        elif changed:
+            bot.send_message(chat_id, "Расписание обновлено ✅")
+        else:
+            bot.send_message(chat_id, "Расписание не изменилось")
+        logging.info(f"{user_info} - Refresh finished, changed={changed}, error={error}")
+
     try:
-        # Запуск команды python ./main.py
-        result = subprocess.run(['python', './main.py'], capture_output=True, text=True)
-        if result.returncode == 0:
-            bot.send_message(message.chat.id, "Команда выполнена успешно:\n" + result.stdout)
+        # Обновление идёт в фоне; повторные запросы присоединяются к текущему
+        if schedule_refresher.trigger(on_done) == 'running':
+            bot.send_message(chat_id, "Обновление уже выполняется, сообщу, когда закончу.\n" + schedule_refresher.status())
         else:
-            bot.send_message(message.chat.id, "Ошибка при выполнении команды:\n" + result.stderr)
-        logging.info(f"{user_info} - Command executed with return code {result.returncode}")
+            bot.send_message(chat_id, "Обновление расписания запущено, сообщу, когда закончу.\n" + schedule_refresher.status())
     except Exception as e:
-        bot.send_message(message.chat.id, f"Произошла ошибка: {e}")
+        handler_failed('update_195')
+        bot.send_message(chat_id, f"Произошла ошибка: {e}")
         logging.error(f"{user_info} - Error: {e}")
 
 
 #Кто дежурит?
 @bot.message_handler(func=lambda message: message.text == "Кто дежурит?")
+@instrumented('who_is_on_duty')
 def who_is_on_duty(message):
     user_info = f"User: {message.from_user.first_name} (@{message.from_user.username or 'No username'})"
     logging.info(f"{user_info} requested 'Кто дежурит?'")
     try:
-        # Подключение к базе данных SQLite
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row  # Позволяет доступ к строкам как к словарям
-        cursor = conn.cursor()
+        schedule_index = get_schedule_index(STORE_DIR)
 
         # Получение текущей даты и времени
         now = datetime.now()
-        current_date = now.strftime('%d.%m.%Y')
-        current_time = now.time()
-
-        # Лог текущей даты и времени для отладки
-        print(f"Текущая дата: {current_date}, текущее время: {current_time}")
 
-        # Запрос для получения дежурных на текущую дату
-        query = """
-        SELECT * FROM schedule
-        WHERE Date = ?
-        """
-        cursor.execute(query, (current_date,))
-        rows = cursor.fetchall()
-
-        if not rows:
+        if not schedule_index.has_day(now.date()):
             bot.send_message(message.chat.id, "Сегодня никто не дежурит или данные недоступны.")
             logging.info(f"{user_info} - No duty data available for today")
-            print("На текущую дату данные отсутствуют.")
             return
 
-        # Лог извлечённых строк для отладки
-        print(f"Извлечённые строки: {rows}")
-
-        # Поиск колонок со значением "duty" для текущего временного интервала
-        on_duty = []
-        for row in rows:
-            time_range = row["Time"]
-            if is_time_in_range(time_range, current_time):
-                for col_name in row.keys():  # Доступ к именам колонок
-                    value = row[col_name]  # Доступ к значениям колонок
-                    if value == "duty":
-                        on_duty.append(col_name)
-
-        # Лог колонок дежурных для отладки
-        print(f"Дежурные колонки: {on_duty}")
+        on_duty = schedule_index.on_duty_at(now)
 
         if on_duty:
             bot.send_message(message.chat.id, f"Сейчас дежурят: {', '.join(on_duty)}")
@@ -144,17 +328,65 @@ def who_is_on_duty(message):
             logging.info(f"{user_info} - No one is on duty now")
 
     except Exception as e:
+        handler_failed('who_is_on_duty')
         bot.send_message(message.chat.id, f"Произошла ошибка: {e}")
         logging.error(f"{user_info} - Error: {e}")
-        print(f"Ошибка: {e}")
-    finally:
-        conn.close()
 
 
+#Кто дежурит в указанное время: /duty_at 14:30, /duty_at 25.12 14:30, /duty_at 25.12.2024 14:30
+@bot.message_handler(commands=['duty_at'])
+@instrumented('who_is_on_duty_at')
+def who_is_on_duty_at(message):
+    user_info = f"User: {message.from_user.first_name} (@{message.from_user.username or 'No username'})"
+    logging.info(f"{user_info} sent {message.text}")
+    try:
+        parts = message.text.split(maxsplit=1)
+        moment = parse_moment(parts[1]) if len(parts) > 1 else None
+        if moment is None:
+            bot.send_message(message.chat.id, "Укажи время: /duty_at 14:30, /duty_at 25.12 14:30 или /duty_at 25.12.2024 14:30")
+            return
+
+        on_duty = get_schedule_index(STORE_DIR).on_duty_at(moment)
+        if on_duty:
+            bot.send_message(message.chat.id, f"{moment:%d.%m.%Y %H:%M} дежурят: {', '.join(on_duty)}")
+        else:
+            bot.send_message(message.chat.id, f"{moment:%d.%m.%Y %H:%M} никто не дежурит.")
+        logging.info(f"{user_info} - On duty at {moment:%d.%m.%Y %H:%M}: {', '.join(on_duty)}")
+
+    except Exception as e:
+        handler_failed('who_is_on_duty_at')
+        bot.send_message(message.chat.id, f"Произошла ошибка: {e}")
+        logging.error(f"{user_info} - Error: {e}")
+
+
+#Кто следующий?
+@bot.message_handler(commands=['next_duty'])
+@bot.message_handler(func=lambda message: message.text == "Кто следующий?")
+@instrumented('who_is_next_on_duty')
+def who_is_next_on_duty(message):
+    user_info = f"User: {message.from_user.first_name} (@{message.from_user.username or 'No username'})"
+    logging.info(f"{user_info} requested 'Кто следующий?'")
+    try:
+        next_duty = get_schedule_index(STORE_DIR).next_duty(datetime.now())
+        if next_duty is None:
+            bot.send_message(message.chat.id, "Следующих дежурств в расписании нет.")
+            logging.info(f"{user_info} - No upcoming duty")
+            return
+
+        start, shifts = next_duty
+        lines = [f"{employee} до {end:%d.%m %H:%M}" for employee, end in shifts]
+        bot.send_message(message.chat.id, f"Следующее дежурство с {start:%d.%m.%Y %H:%M}: {', '.join(lines)}")
+        logging.info(f"{user_info} - Next duty at {start:%d.%m.%Y %H:%M}: {', '.join(lines)}")
+
+    except Exception as e:
+        handler_failed('who_is_next_on_duty')
+        bot.send_message(message.chat.id, f"Произошла ошибка: {e}")
+        logging.error(f"{user_info} - Error: {e}")
 
 
 #Моё расписание
 @bot.message_handler(func=lambda message: message.text == "Моё расписание")
+@instrumented('my_schedule_handler')
 def my_schedule_handler(message):
     user_info = f"User: {message.from_user.first_name} (@{message.from_user.username or 'No username'})"
     logging.info(f"{user_info} requested 'Моё расписание'")
@@ -163,26 +395,40 @@ def my_schedule_handler(message):
         telebot.types.KeyboardButton("На завтра"),
         telebot.types.KeyboardButton("3️⃣"),
         telebot.types.KeyboardButton("7️⃣"),
-        telebot.types.KeyboardButton("Покажи весь месяц")
+        telebot.types.KeyboardButton("Покажи весь месяц"),
+        telebot.types.KeyboardButton("Следующий месяц")
     )
     bot.send_message(message.chat.id, "На сколько дней вперед вывести твоё расписание? 🗓", reply_markup=markup)
-    user_context[message.chat.id] = {'command': 'my_schedule'}
+    user_context.set(message.chat.id, {'command': 'my_schedule'})
 
-@bot.message_handler(func=lambda message: message.chat.id in user_context and user_context[message.chat.id]['command'] == 'my_schedule')
+@bot.message_handler(func=lambda message: user_context.get(message.chat.id, {}).get('command') == 'my_schedule')
+@instrumented('handle_schedule_days_input')
 def handle_schedule_days_input(message):
     user_info = f"User: {message.from_user.first_name} (@{message.from_user.username or 'No username'})"
     try:
+        # Получаем текущую дату
+        today = datetime.now().date()
+        next_month = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+        # Период вывода расписания; он может захватывать несколько месяцев
         user_input = message.text.strip()
+        start_date = today
         if user_input == "На завтра":
-            days = 2
+            end_date = today + timedelta(days=1)
         elif user_input == "3️⃣":
-            days = 4
+            end_date = today + timedelta(days=3)
         elif user_input == "7️⃣":
-            days = 8
+            end_date = today + timedelta(days=7)
         elif user_input == "Покажи весь месяц":
-            days = 31  # Максимально возможное количество дней в месяце
+            end_date = next_month - timedelta(days=1)  # Последний день текущего месяца
+        elif user_input == "Следующий месяц":
+            start_date = next_month
+            end_date = (next_month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
         else:
             days = int(user_input)
+            if not 0 < days <= MAX_SCHEDULE_DAYS:
+                raise ValueError(days)
+            end_date = today + timedelta(days=days - 1)
 
         username = f"@{message.from_user.username}" if message.from_user.username else None
 
@@ -191,94 +437,99 @@ def handle_schedule_days_input(message):
             logging.info(f"{user_info} - No username provided, schedule lookup failed.")
             return
 
-        # Подключение к базе данных
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        # Расписание пользователя из кеша отрендеренных строк; месяцы вне памяти подгружаются по запросу
+        schedule = render_cache.render(get_schedule_index(STORE_DIR), username, start_date, end_date, today)
 
-        # Получаем текущую дату
-        today = datetime.now()
-        last_day = today.replace(day=1) + timedelta(days=32)  # Переходим на следующий месяц
-        last_day = last_day.replace(day=1) - timedelta(days=1)  # Последний день текущего месяца
-
-        # Рассчитываем конечную дату вывода расписания
-        end_date = today + timedelta(days=days - 1)
-        if end_date > last_day:
-            end_date = last_day
-            bot.send_message(message.chat.id, "я пока умею работать только в пределах текущего месяца, сорри")
-
-        # Форматируем даты для SQL
-        start_date_str = today.strftime('%d.%m.%Y')
-        end_date_str = end_date.strftime('%d.%m.%Y')
-
-        # Запрос для получения расписания пользователя
-        query = f"""
-        SELECT Date, Time, `{username}`
-        FROM schedule
-        WHERE Date BETWEEN ? AND ?
-        """
-        cursor.execute(query, (start_date_str, end_date_str))
-        rows = cursor.fetchall()
-
-        if not rows:
+        if schedule:
+            # Длинный период не помещается в одно сообщение Telegram
+            for table in split_message(schedule):
+                bot.send_message(message.chat.id, table, parse_mode="MarkdownV2")
+            logging.info(f"{user_info} - Schedule sent for {username}")
+        else:
             bot.send_message(message.chat.id, "Тебя нет в расписании, старина")
             logging.info(f"{user_info} - No schedule found for {username}")
-        else:
-            schedule = []
-            for row in rows:
-                status = row[username]
-                if status is None:
-                    continue
-                formatted_status = STATUS_MAPPING.get(status, status)
-                weekday = get_weekday(row['Date'])
-                today_marker = " 👈 Сегодня" if row['Date'] == today.strftime('%d.%m.%Y') else ""
-                if status == 'duty':
-                    schedule.append(f"*{escape_markdown(row['Date'])}* \\({escape_markdown(weekday)}\\) \\- {escape_markdown(formatted_status)} {escape_markdown(row['Time'])}{escape_markdown(today_marker)}\n")
-                else:
-                    schedule.append(f"*{escape_markdown(row['Date'])}* \\({escape_markdown(weekday)}\\) \\- {escape_markdown(formatted_status)}{escape_markdown(today_marker)}\n")
-
-            if schedule:
-                table = "\n".join(schedule)
-                bot.send_message(message.chat.id, table, parse_mode="MarkdownV2")
-                logging.info(f"{user_info} - Schedule sent for {username}")
-            else:
-                bot.send_message(message.chat.id, "Тебя нет в расписании, старина")
-                logging.info(f"{user_info} - No schedule found after filtering for {username}")
 
         # Возврат кнопок по умолчанию
         markup = telebot.types.ReplyKeyboardMarkup(resize_keyboard=True)
         button_duty = telebot.types.KeyboardButton("Кто дежурит?")
         button_schedule = telebot.types.KeyboardButton("Моё расписание")
-        markup.add(button_duty, button_schedule)
+        button_next = telebot.types.KeyboardButton("Кто следующий?")
+        markup.add(button_duty, button_schedule, button_next)
         bot.send_message(message.chat.id, "____________", reply_markup=markup)
 
     except ValueError:
-        bot.send_message(message.chat.id, "Пожалуйста, введите корректное число дней.")
+        current_context()['outcome'] = 'invalid_input'
+        bot.send_message(message.chat.id, f"Пожалуйста, введите число дней от 1 до {MAX_SCHEDULE_DAYS}.")
         logging.info(f"{user_info} - Invalid input for schedule days.")
     except Exception as e:
+        handler_failed('handle_schedule_days_input')
         bot.send_message(message.chat.id, f"Произошла ошибка: {e}")
         logging.error(f"{user_info} - Error: {e}")
     finally:
-        if 'conn' in locals():
-            conn.close()
         user_context.pop(message.chat.id, None)
 
 
-# Функция для проверки, входит ли текущее время в заданный диапазон
-def is_time_in_range(time_range, current_time):
-    try:
-        start_time, end_time = time_range.split('-')
-        start_time = datetime.strptime(start_time.strip(), '%H:%M').time()
-        end_time = datetime.strptime(end_time.strip(), '%H:%M').time()
-
-        if start_time <= end_time:
-            return start_time <= current_time <= end_time
-        else:  # Случай, если смена ночная
-            return current_time >= start_time or current_time <= end_time
-    except ValueError:
-        return False
-    
+# Разбиение строк расписания на сообщения не длиннее MAX_MESSAGE_LENGTH
+def split_message(lines, limit=MAX_MESSAGE_LENGTH):
+    chunks = []
+    current = ""
+    for line in lines:
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# Разбор момента времени для /duty_at: 'HH:MM', 'DD.MM HH:MM' или 'DD.MM.YYYY HH:MM'
+def parse_moment(text):
+    now = datetime.now()
+    text = text.strip()
+    # Дата без года разбирается сразу с текущим годом: иначе strptime берёт 1900-й, и 29.02 не существует
+    candidates = (
+        (text, '%H:%M'),
+        (f"{now.year}.{text}", '%Y.%d.%m %H:%M'),
+        (text, '%d.%m.%Y %H:%M'),
+    )
+    for value, fmt in candidates:
+        try:
+            moment = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if fmt == '%H:%M':
+            return now.replace(hour=moment.hour, minute=moment.minute, second=0, microsecond=0)
+        return moment
+    return None
+
 
 # Запуск бота
-logging.info("Бот запущен...")
-bot.infinity_polling()
+if __name__ == '__main__':
+    from schedule_to_sql import migrate_legacy_db
+    # Старая база относится к таблице CSV_URL, то есть к первой (или единственной) команде
+    try:
+        migrated = migrate_legacy_db(LEGACY_DB_PATH, STORE_DIR, SCHEDULE_SOURCES[0].team)
+    except Exception as e:
+        # Без старой базы хранилище просто соберётся из таблиц
+        logging.warning(f"Не удалось перенести {LEGACY_DB_PATH}: {e}")
+        migrated = []
+    if migrated:
+        logging.info(f"{LEGACY_DB_PATH} перенесена в хранилище: {len(migrated)} разделов, файл можно удалить")
+    start_http_server(HTTP_PORT)
+    outbound.start()
+    if REMINDERS:
+        reminders.rebuild(get_schedule_index(STORE_DIR))
+        reminders.start()
+    if migrated or not get_schedule_index(STORE_DIR).months:
+        # Хранилище пустое (первый запуск) или собрано из старой базы — загружаем таблицы сразу, не дожидаясь таймера
+        schedule_refresher.trigger()
+    schedule_refresher.start()
+    logging.info("Бот запущен...")
+    if WEBHOOK_URL and start_webhook():
+        # Обновления принимает HTTP-сервер, основной поток просто ждёт
+        threading.Event().wait()
+    else:
+        # Long polling не работает, пока у бота зарегистрирован вебхук
+        bot.remove_webhook()
+        bot.infinity_polling()
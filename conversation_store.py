@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ConversationStore:
+    """
+    Состояние диалогов с пользователями (например, ожидание ответа на «Моё расписание»).
+
+    Каждая запись живёт не дольше ttl секунд, а при превышении max_entries
+    вытесняется запись, к которой дольше всего не обращались, поэтому
+    брошенные диалоги не копятся. Доступ защищён блокировкой, так как
+    обработчики выполняются в нескольких потоках.
+    """
+
+    def __init__(self, ttl=900, max_entries=10000):
+        """
+        :param ttl: время жизни записи в секундах
+        :param max_entries: максимальное количество записей
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id, default=None):
+        """Состояние диалога или default, если его нет или оно истекло"""
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None:
+                return default
+            expires_at, state = entry
+            if expires_at <= time.monotonic():
+                del self._entries[chat_id]
+                return default
+            self._entries.move_to_end(chat_id)
+            return state
+
+    def set(self, chat_id, state):
+        """Сохраняет состояние диалога; время жизни отсчитывается заново"""
+        now = time.monotonic()
+        with self._lock:
+            self._entries[chat_id] = (now + self.ttl, state)
+            self._entries.move_to_end(chat_id)
+            # Сначала вытесняем самые давние записи сверх лимита, затем истёкшие в начале очереди
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            while self._entries:
+                expires_at, _ = next(iter(self._entries.values()))
+                if expires_at > now:
+                    break
+                self._entries.popitem(last=False)
+
+    def pop(self, chat_id, default=None):
+        """Удаляет состояние диалога и возвращает его"""
+        with self._lock:
+            entry = self._entries.pop(chat_id, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SqliteConversationStore:
+    """
+    То же хранилище диалогов в файле SQLite: состояние переживает перезапуск бота.
+
+    Состояние сохраняется в JSON. Отдельный файл нужен потому, что разделы
+    расписания пересобираются и подменяются при каждом обновлении расписания.
+    """
+
+    def __init__(self, db_path, ttl=900, max_entries=10000):
+        """
+        :param db_path: путь к файлу базы диалогов
+        :param ttl: время жизни записи в секундах
+        :param max_entries: максимальное количество записей
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                chat_id INTEGER PRIMARY KEY,
+                state TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                touched_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_touched ON conversations (touched_at)")
+        self._conn.execute("DELETE FROM conversations WHERE expires_at <= ?", (time.time(),))
+
+    def get(self, chat_id, default=None):
+        """Состояние диалога или default, если его нет или оно истекло"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM conversations WHERE chat_id = ? AND expires_at > ?", (chat_id, now)
+            ).fetchone()
+            if row is None:
+                return default
+            self._conn.execute("UPDATE conversations SET touched_at = ? WHERE chat_id = ?", (now, chat_id))
+        return json.loads(row[0])
+
+    def set(self, chat_id, state):
+        """Сохраняет состояние диалога; время жизни отсчитывается заново"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO conversations (chat_id, state, expires_at, touched_at) VALUES (?, ?, ?, ?)",
+                    (chat_id, json.dumps(state, ensure_ascii=False), now + self.ttl, now)
+                )
+                self._conn.execute("DELETE FROM conversations WHERE expires_at <= ?", (now,))
+                self._conn.execute("""
+                    DELETE FROM conversations WHERE chat_id IN (
+                        SELECT chat_id FROM conversations ORDER BY touched_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def pop(self, chat_id, default=None):
+        """Удаляет состояние диалога и возвращает его"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, expires_at FROM conversations WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            if row is None:
+                return default
+            self._conn.execute("DELETE FROM conversations WHERE chat_id = ?", (chat_id,))
+        if row[1] <= time.time():
+            return default
+        return json.loads(row[0])
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+
+def create_conversation_store(db_path=None, ttl=900, max_entries=10000):
+    """Хранилище в памяти или, если указан db_path, в файле SQLite"""
+    if db_path:
+        return SqliteConversationStore(db_path, ttl, max_entries)
+    return ConversationStore(ttl, max_entries)
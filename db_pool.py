@@ -0,0 +1,82 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class ReadOnlyConnectionPool:
+    """
+    Небольшой пул read-only соединений SQLite, общий для потоков-обработчиков.
+
+    База пересобирается во временном файле и подменяется через os.replace,
+    поэтому открытый файл никогда не меняется на месте: соединения
+    открываются с mode=ro&immutable=1 и читают без блокировок. При подмене
+    файла пул открывает соединения к новому файлу, а старые закрываются
+    по мере возврата.
+    """
+
+    def __init__(self, db_path, size=4):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._signature = None
+        self._semaphore = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        uri = f"file:{os.path.abspath(self.db_path)}?mode=ro&immutable=1"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def _current_signature(self):
+        st = os.stat(self.db_path)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    @contextmanager
+    def connection(self):
+        """Выдаёт соединение из пула и возвращает его обратно после использования"""
+        with self._semaphore:
+            signature = self._current_signature()
+            with self._lock:
+                if signature != self._signature:
+                    # Файл базы подменён — старые соединения больше не нужны
+                    self._drain()
+                    self._signature = signature
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                with self._lock:
+                    if signature == self._signature:
+                        self._idle.put(conn)
+                    else:
+                        conn.close()
+
+    def _drain(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def close(self):
+        with self._lock:
+            self._drain()
+            self._signature = None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path, size=None):
+    """Возвращает общий пул для файла базы, создавая его при первом обращении"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = ReadOnlyConnectionPool(db_path, size or int(os.getenv('DB_POOL_SIZE', '4')))
+            _pools[db_path] = pool
+        return pool
@@ -0,0 +1,87 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Таблица маршрутов: (метод, путь) -> обработчик(request) -> (статус, заголовки, тело)
+ROUTES = {}
+
+# Маршруты по префиксу пути; проверяются после точных, более длинные префиксы первыми
+PREFIX_ROUTES = {}
+
+
+def route(method, path, prefix=False):
+    """
+    Регистрирует обработчик HTTP-запроса для метода и пути.
+
+    :param prefix: обработчик получает все пути, начинающиеся с path
+    """
+    def decorator(func):
+        (PREFIX_ROUTES if prefix else ROUTES)[(method, path)] = func
+        return func
+    return decorator
+
+
+def _find_handler(method, path):
+    handler = ROUTES.get((method, path))
+    if handler is not None:
+        return handler
+    matches = [(len(prefix), handler) for (route_method, prefix), handler in PREFIX_ROUTES.items()
+               if route_method == method and path.startswith(prefix)]
+    return max(matches, key=lambda match: match[0])[1] if matches else None
+
+
+def query_params(request):
+    """Параметры строки запроса: имя -> первое значение"""
+    return {name: values[0] for name, values in parse_qs(urlsplit(request.path).query).items()}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method, send_body=True):
+        path = self.path.split('?', 1)[0]
+        handler = _find_handler(method, path)
+        if handler is None:
+            status, headers, body = 404, {'Content-Type': 'text/plain; charset=utf-8'}, b'Not Found'
+        else:
+            try:
+                status, headers, body = handler(self)
+            except Exception as e:
+                logging.error(f"HTTP {method} {path} - Error: {e}")
+                status, headers, body = 500, {'Content-Type': 'text/plain; charset=utf-8'}, b'Internal Server Error'
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_HEAD(self):
+        self._handle('GET', send_body=False)
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class _Server(ThreadingHTTPServer):
+    # Очередь соединений по умолчанию (5) переполняется при всплеске запросов
+    # вебхука, и клиенты ждут повторной отправки SYN около секунды
+    request_queue_size = 128
+
+
+def start_http_server(port, host='0.0.0.0'):
+    """Запускает встроенный HTTP-сервер в фоновом потоке"""
+    httpd = _Server((host, port), _RequestHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name='http-server', daemon=True).start()
+    logging.info(f"HTTP server listening on {host}:{port}")
+    return httpd
@@ -1,12 +1,19 @@
 from dotenv import load_dotenv
+import logging
 import os
-from schedule_to_sql import download_and_process_schedule
+from schedule_store import load_sources
+from schedule_to_sql import STORE_DIR, download_and_process_sources
 
 # Загружаем переменные окружения из файла .env
 load_dotenv()
 
-# Получаем ссылку на CSV файл из переменной окружения
-csv_url = os.getenv('CSV_URL')
-
-# Вызываем функцию, чтобы скачать и обработать CSV
-download_and_process_schedule(csv_url)
+# Получаем таблицы команд (SCHEDULE_SOURCES) или одну ссылку на CSV файл (CSV_URL)
+if __name__ == '__main__':
+    # Ход загрузки пишется в лог, при ручном запуске — в консоль
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    try:
+        sources = load_sources(os.getenv('SCHEDULE_SOURCES'), os.getenv('CSV_URL'))
+        download_and_process_sources(sources, os.getenv('SCHEDULE_STORE', STORE_DIR))
+    except Exception as e:
+        logging.error(e)
+        exit(1)
@@ -0,0 +1,171 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http_server import route
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик"""
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Текущее значение; может вычисляться функцией в момент сбора"""
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        super().__init__(name, documentation, labelnames)
+        self._func = func
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self._func is not None:
+            value = self._func()
+            return [] if value is None else [f"{self.name} {_format_value(value)}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Гистограмма длительностей с накопительными корзинами"""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет длительность блока with, в том числе завершившегося исключением"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def drain(self):
+        """Забирает накопленные наблюдения и обнуляет гистограмму (для передачи из другого процесса)"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        """Добавляет наблюдения, полученные из drain() в другом процессе"""
+        with self._lock:
+            for key, (counts, total) in values.items():
+                current, current_total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+                self._values[key] = ([a + b for a, b in zip(current, counts)], current_total + total)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render_metrics():
+    """Все зарегистрированные метрики в текстовом формате Prometheus"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+# Метрики бота
+HANDLER_DURATION = Histogram('bot_handler_duration_seconds', 'Длительность обработки сообщения', ['handler'])
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Ошибки обработчиков сообщений', ['handler'])
+TELEGRAM_API_DURATION = Histogram('telegram_api_duration_seconds', 'Длительность вызовов Telegram Bot API', ['method'])
+WEBHOOK_UPDATES = Counter('bot_webhook_updates_total', 'Обновления, полученные через вебхук', ['result'])
+OUTBOUND_MESSAGES = Counter('bot_outbound_messages_total', 'Сообщения, отправленные через очередь рассылки', ['result'])
+
+# Метрики загрузки расписания
+INGEST_STAGE_DURATION = Histogram('schedule_ingest_stage_duration_seconds', 'Длительность этапов загрузки расписания', ['stage'])
+INGEST_RUNS = Counter('schedule_ingest_runs_total', 'Запуски загрузки расписания', ['result'])
+SCHEDULE_ROWS = Gauge('schedule_source_rows', 'Строк в последних загруженных таблицах команды', ['team'])
+SCHEDULE_COLUMNS = Gauge('schedule_source_columns', 'Колонок в самой широкой таблице команды', ['team'])
+
+# Метрики HTTP API расписания
+API_REQUESTS = Counter('schedule_api_requests_total', 'Запросы к HTTP API расписания', ['endpoint', 'status'])
+
+
+@route('GET', '/metrics')
+def metrics_endpoint(request):
+    return 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}, render_metrics().encode('utf-8')
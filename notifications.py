@@ -0,0 +1,113 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from outbound import MAX_MESSAGE_LENGTH, message_length
+from schedule_render import STATUS_MAPPING, get_weekday
+from schedule_schema import format_interval
+
+
+class ChatRegistry:
+    """
+    Соответствие никнейма Telegram и личного чата с ботом.
+
+    Бот не может написать пользователю по никнейму, поэтому чат запоминается
+    из его сообщений. Хранится в отдельном файле SQLite, чтобы переживать
+    перезапуски и подмену разделов расписания; чтение идёт из копии в памяти.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chats (
+                username TEXT PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._chats = dict(self._conn.execute("SELECT username, chat_id FROM chats"))
+
+    def remember(self, username, chat_id):
+        """Запоминает чат пользователя; в базу пишется только изменившееся соответствие"""
+        username = f"@{username.lstrip('@')}".lower()
+        if self._chats.get(username) == chat_id:
+            return
+        with self._lock:
+            self._chats[username] = chat_id
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chats (username, chat_id, updated_at) VALUES (?, ?, ?)",
+                (username, chat_id, time.time())
+            )
+
+    def chat_id(self, username):
+        """Чат пользователя по никнейму (с @ или без) или None"""
+        return self._chats.get(f"@{username.lstrip('@')}".lower())
+
+    def __len__(self):
+        return len(self._chats)
+
+
+def format_changes(changes, limit=MAX_MESSAGE_LENGTH):
+    """
+    Текст уведомления об изменениях в расписании одного сотрудника.
+
+    Новый сотрудник или переименованная колонка дают строку на каждый
+    интервал каждого дня, поэтому текст обрезается до limit (см.
+    message_length), а о не поместившихся изменениях говорит последняя строка.
+
+    :param changes: список ScheduleChange со статусами-именами
+    """
+    lines = ["Твоё расписание изменилось:"]
+    # Место под последнюю строку с наибольшим возможным числом
+    budget = limit - message_length(f"\n… и ещё {len(changes)} изменений")
+    length = message_length(lines[0])
+    for shown, change in enumerate(changes):
+        day = date.fromisoformat(change.date)
+        old = STATUS_MAPPING.get(change.old_status, change.old_status) or "—"
+        new = STATUS_MAPPING.get(change.new_status, change.new_status) or "—"
+        # Интервал может быть не распознан (пустая ячейка времени) — тогда только дата
+        time_range = format_interval(change.start_min, change.end_min)
+        when = f"{day:%d.%m.%Y} ({get_weekday(day)}) {time_range}".rstrip()
+        line = f"{when}: {old} → {new}"
+        remaining = len(changes) - shown
+        line_length = message_length(line)
+        if length + 1 + line_length > (limit if remaining == 1 else budget):
+            lines.append(f"… и ещё {remaining} изменений")
+            break
+        lines.append(line)
+        length += 1 + line_length
+    return "\n".join(lines)
+
+
+def notify_changes(changes, registry, outbound, today=None):
+    """
+    Рассылает каждому затронутому сотруднику одно сообщение о его изменениях.
+
+    Сотрудники — никнеймы из HEAD_MAPPING; прошедшие даты и сотрудники,
+    ни разу не писавшие боту, пропускаются.
+
+    :return: количество поставленных в очередь сообщений
+    """
+    today = (today or date.today()).isoformat()
+    by_employee = {}
+    for change in changes:
+        if change.date >= today:
+            by_employee.setdefault(change.employee, []).append(change)
+
+    queued = 0
+    for employee, employee_changes in by_employee.items():
+        chat_id = registry.chat_id(employee)
+        if chat_id is None:
+            logging.info(f"Schedule changed for {employee}, but the chat is unknown")
+            continue
+        outbound.put(chat_id, format_changes(employee_changes))
+        queued += 1
+    logging.info(f"Schedule change notifications queued: {queued} of {len(by_employee)} employees")
+    return queued
@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from metrics import OUTBOUND_MESSAGES
+
+# Ограничения Telegram Bot API: около 30 сообщений в секунду всего и не больше одного в секунду в один чат
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+
+# Максимальная длина одного сообщения (в единицах UTF-16, см. message_length)
+MAX_MESSAGE_LENGTH = 4096
+
+# Сколько раз повторять сообщение, получившее 429 Too Many Requests
+MAX_RETRIES = 5
+
+
+def message_length(text):
+    """Длина текста так, как её считает Telegram: в единицах UTF-16 (эмодзи — от двух)"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def retry_after(error):
+    """
+    Пауза в секундах из ответа 429 Too Many Requests или None для других ошибок.
+
+    Telegram передаёт её в parameters.retry_after; pyTelegramBotAPI кладёт
+    ответ в ApiTelegramException.result_json.
+    """
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    parameters = (getattr(error, 'result_json', None) or {}).get('parameters') or {}
+    return float(parameters.get('retry_after') or 1)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Сколько секунд ждать до появления токена (0 — токен есть)"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+    def pause(self, now, seconds):
+        """Следующий токен появится не раньше чем через seconds"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class OutboundQueue:
+    """
+    Очередь исходящих сообщений с соблюдением лимитов Telegram.
+
+    Сообщения раздаются одним фоновым потоком: общий лимит на бота и
+    отдельный на каждый чат. Чаты обслуживаются по очереди, так что
+    длинная рассылка одному пользователю не задерживает остальных.
+    Несколько ожидающих сообщений одному чату с одинаковыми параметрами
+    склеиваются в одно, пока помещаются в MAX_MESSAGE_LENGTH. Сообщение,
+    получившее 429, возвращается в начало очереди своего чата, а чат
+    замолкает на retry_after секунд.
+    """
+
+    def __init__(self, send_func, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE):
+        """
+        :param send_func: отправка одного сообщения: send_func(chat_id, text, **kwargs)
+        :param global_rate: сообщений в секунду на весь бот
+        :param per_chat_rate: сообщений в секунду в один чат
+        """
+        self.send_func = send_func
+        self.per_chat_rate = per_chat_rate
+
+        # Запас в один токен: сообщения идут равномерно, без всплеска в первую секунду
+        self._global = TokenBucket(global_rate, 1)
+        self._chats = {}
+        self._pending = OrderedDict()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+
+    def start(self):
+        """Запускает поток отправки"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='outbound-queue', daemon=True)
+            self._thread.start()
+        return self
+
+    def put(self, chat_id, text, **kwargs):
+        """Ставит сообщение в очередь и сразу возвращает управление"""
+        with self._lock:
+            self._pending.setdefault(chat_id, deque()).append((text, kwargs, 0))
+            self._changed.notify_all()
+
+    def pending(self):
+        """Количество сообщений, ещё не отправленных"""
+        with self._lock:
+            return sum(len(messages) for messages in self._pending.values()) + self._in_flight
+
+    def join(self, timeout=None):
+        """Ждёт, пока очередь опустеет; возвращает False по таймауту"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+        return True
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate, 1)
+        return bucket
+
+    def _next_batch(self, chat_id):
+        """Снимает с очереди чата первое сообщение и следующие за ним с теми же параметрами"""
+        messages = self._pending[chat_id]
+        text, kwargs, attempts = messages.popleft()
+        while messages and messages[0][1] == kwargs \
+                and message_length(text) + 2 + message_length(messages[0][0]) <= MAX_MESSAGE_LENGTH:
+            text += "\n\n" + messages.popleft()[0]
+        if not messages:
+            del self._pending[chat_id]
+        return text, kwargs, attempts
+
+    def _select(self):
+        """Выбирает чат, которому можно отправить сейчас; иначе возвращает время ожидания"""
+        now = time.monotonic()
+        wait = None
+        for chat_id in self._pending:
+            delay = self._chat_bucket(chat_id).delay(now)
+            if delay == 0:
+                delay = self._global.delay(now)
+                if delay == 0:
+                    self._global.take(now)
+                    self._chats[chat_id].take(now)
+                    # Чат уходит в конец очереди, чтобы остальные не ждали его рассылки
+                    self._pending.move_to_end(chat_id)
+                    return chat_id, None
+            wait = delay if wait is None else min(wait, delay)
+
+        # Вёдра простаивающих чатов больше не нужны
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items()
+                        if chat_id not in self._pending and bucket.full(now)]:
+            del self._chats[chat_id]
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._changed.wait()
+                chat_id, wait = self._select()
+                if chat_id is None:
+                    self._changed.wait(wait)
+                    continue
+                text, kwargs, attempts = self._next_batch(chat_id)
+                self._in_flight += 1
+
+            delay = None
+            try:
+                self.send_func(chat_id, text, **kwargs)
+                OUTBOUND_MESSAGES.inc(result='sent')
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is None or attempts >= MAX_RETRIES:
+                    delay = None
+                    OUTBOUND_MESSAGES.inc(result='failed')
+                    logging.error(f"Outbound message to {chat_id} failed: {e}")
+                else:
+                    OUTBOUND_MESSAGES.inc(result='retried')
+                    logging.warning(f"Outbound message to {chat_id} rate limited, retry in {delay}s")
+            finally:
+                with self._lock:
+                    if delay is not None:
+                        self._pending.setdefault(chat_id, deque()).appendleft((text, kwargs, attempts + 1))
+                        self._chat_bucket(chat_id).pause(time.monotonic(), delay)
+                    self._in_flight -= 1
+                    self._changed.notify_all()
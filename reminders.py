@@ -0,0 +1,163 @@
+import heapq
+import logging
+import threading
+from datetime import datetime, time, timedelta
+
+from schedule_render import STATUS_MAPPING, get_weekday
+
+# Как долго помнить отправленные напоминания, чтобы не повторить их после перестроения
+FIRED_RETENTION = timedelta(days=2)
+
+# Максимальный сон планировщика: так он замечает перевод системных часов
+MAX_SLEEP_SECONDS = 60
+
+
+def _duty_blocks(index, now):
+    """
+    Непрерывные дежурства сотрудников, начинающиеся после now.
+
+    Смены, идущие встык (день и следующая за ним ночь), объединяются в одну;
+    продолжение дежурства, начавшегося до now, пропускается.
+
+    :return: список (сотрудник, начало, конец)
+    """
+    blocks = {}
+    for start, shifts in index.duty_starts_after(now):
+        before = None
+        for employee, end in shifts:
+            employee_blocks = blocks.get(employee)
+            if employee_blocks and employee_blocks[-1][1] >= start:
+                employee_blocks[-1][1] = max(employee_blocks[-1][1], end)
+                continue
+            if employee_blocks is None:
+                if before is None:
+                    before = index.on_duty_at(start - timedelta(minutes=1))
+                if employee in before:
+                    blocks[employee] = [[None, end]]
+                    continue
+            blocks.setdefault(employee, []).append([start, end])
+    return [(employee, start, end)
+            for employee, employee_blocks in blocks.items()
+            for start, end in employee_blocks if start is not None]
+
+
+def format_day(day, entries):
+    """Статус на день без разметки: «Дежурный 🚨 09:00-21:00» или «Выходной 🌴»"""
+    parts = []
+    for status, time_range in entries:
+        text = STATUS_MAPPING.get(status, status)
+        part = f"{text} {time_range}" if status == 'duty' else text
+        # Одинаковый статус в дневном и ночном интервалах выводится один раз
+        if part not in parts:
+            parts.append(part)
+    return f"Завтра, {day:%d.%m.%Y} ({get_weekday(day)}): {', '.join(parts)}"
+
+
+def build_reminders(index, now, lead, evening):
+    """
+    Напоминания по индексу расписания, которые ещё не наступили.
+
+    - за lead до начала каждого дежурства (если до начала меньше lead — сразу);
+    - накануне в evening — статус на следующий день.
+
+    :return: список (время, ключ, сотрудник, текст); ключ уникален для напоминания
+    """
+    reminders = []
+    for employee, start, end in _duty_blocks(index, now):
+        reminders.append((
+            max(start - lead, now),
+            ('duty', employee, start),
+            employee,
+            f"Напоминание: дежурство с {start:%d.%m %H:%M} до {end:%d.%m %H:%M} 🚨"
+        ))
+
+    for _, month_index in index.indexes(now.date()):
+        for day in sorted(month_index.dates):
+            fire_at = datetime.combine(day - timedelta(days=1), evening)
+            if fire_at < now:
+                continue
+            for employee, days in month_index.by_employee.items():
+                entries = days.get(day)
+                if entries:
+                    reminders.append((fire_at, ('evening', employee, day), employee, format_day(day, entries)))
+    return reminders
+
+
+class ReminderScheduler:
+    """
+    Напоминания о сменах на очереди с приоритетом по времени срабатывания.
+
+    Очередь перестраивается из индекса расписания после каждого обновления.
+    Сработавшие напоминания отдаются в очередь рассылки целиком, поэтому
+    всплеск в 09:00 для большой команды не задерживает обработчики бота:
+    сообщения уходят в темпе, допустимом для Telegram.
+    """
+
+    def __init__(self, outbound, registry, lead=timedelta(hours=1), evening=time(20, 0)):
+        """
+        :param outbound: очередь рассылки (OutboundQueue)
+        :param registry: соответствие никнеймов и чатов (ChatRegistry)
+        :param lead: за сколько до начала дежурства напоминать
+        :param evening: время вечернего напоминания о следующем дне
+        """
+        self.outbound = outbound
+        self.registry = registry
+        self.lead = lead
+        self.evening = evening
+
+        self._heap = []
+        self._fired = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+
+    def start(self):
+        """Запускает поток планировщика"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='reminders', daemon=True)
+            self._thread.start()
+        return self
+
+    def rebuild(self, index, now=None):
+        """Перестраивает очередь напоминаний по новому индексу расписания"""
+        now = now or datetime.now()
+        reminders = build_reminders(index, now, self.lead, self.evening)
+        with self._lock:
+            self._fired = {key: fired_at for key, fired_at in self._fired.items()
+                           if fired_at > now - FIRED_RETENTION}
+            self._heap = [reminder for reminder in reminders if reminder[1] not in self._fired]
+            heapq.heapify(self._heap)
+            self._changed.notify_all()
+        logging.info(f"Reminders scheduled: {len(self._heap)}")
+
+    def pending(self):
+        """Количество запланированных напоминаний"""
+        with self._lock:
+            return len(self._heap)
+
+    def _due(self):
+        """Снимает с очереди наступившие напоминания; иначе ждёт ближайшего"""
+        with self._lock:
+            while True:
+                now = datetime.now()
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                delay = (self._heap[0][0] - now).total_seconds() if self._heap else None
+                self._changed.wait(MAX_SLEEP_SECONDS if delay is None else min(delay, MAX_SLEEP_SECONDS))
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                reminder = heapq.heappop(self._heap)
+                self._fired[reminder[1]] = now
+                due.append(reminder)
+            return due
+
+    def _run(self):
+        while True:
+            due = self._due()
+            sent = 0
+            for _, _, employee, text in due:
+                chat_id = self.registry.chat_id(employee)
+                if chat_id is not None:
+                    self.outbound.put(chat_id, text)
+                    sent += 1
+            logging.info(f"Reminders due: {len(due)}, queued: {sent}")
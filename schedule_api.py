@@ -0,0 +1,298 @@
+import hashlib
+import hmac
+import json
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta, timezone
+from urllib.parse import unquote, urlsplit
+
+from http_server import query_params, route
+from metrics import API_REQUESTS
+from schedule_render import STATUS_MAPPING
+from schedule_schema import parse_interval
+
+# Период расписания сотрудника по умолчанию и самый длинный период, дней
+DEFAULT_RANGE_DAYS = 31
+MAX_RANGE_DAYS = 366
+
+# Сколько готовых ответов держать в памяти
+RESPONSE_CACHE_SIZE = 256
+
+JSON_TYPE = 'application/json; charset=utf-8'
+ICALENDAR_TYPE = 'text/calendar; charset=utf-8'
+
+# Длина строки iCalendar в байтах, после которой строка переносится (RFC 5545, 3.1)
+ICALENDAR_LINE_OCTETS = 75
+
+
+class ApiError(Exception):
+    """Ошибка запроса, которая отдаётся клиенту с кодом status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _etag(*key):
+    """ETag по ключу ответа: одинаковый ключ — одинаковое тело"""
+    return '"' + hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).hexdigest() + '"'
+
+
+def _etag_matches(header, etag):
+    """Совпадает ли ETag с заголовком If-None-Match (список, слабые ETag, «*»)"""
+    if not header:
+        return False
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+def _parse_date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ApiError(400, f"{name}: ожидается дата YYYY-MM-DD") from None
+
+
+def _parse_moment(value):
+    """Момент времени в ISO 8601; с часовым поясом переводится в местное время"""
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ApiError(400, "at: ожидается время YYYY-MM-DDTHH:MM") from None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def _shift_times(day, time_range):
+    """Начало и конец смены как datetime или (None, None), если интервал не указан"""
+    start_min, end_min = parse_interval(time_range)
+    if start_min is None:
+        return None, None
+    midnight = datetime.combine(day, time())
+    return midnight + timedelta(minutes=start_min), midnight + timedelta(minutes=end_min)
+
+
+def _ics_text(text):
+    """Экранирование текстового значения iCalendar"""
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _ics_fold(line):
+    """Перенос длинной строки iCalendar, не разрывая многобайтовые символы"""
+    parts = []
+    current, size = '', 0
+    for char in line:
+        char_size = len(char.encode('utf-8'))
+        if size + char_size > ICALENDAR_LINE_OCTETS:
+            parts.append(current)
+            # Строка продолжения начинается с пробела, который тоже занимает байт
+            current, size = ' ', 1
+        current += char
+        size += char_size
+    parts.append(current)
+    return '\r\n'.join(parts)
+
+
+def render_icalendar(employee, schedule, stamp):
+    """
+    Календарь iCalendar с расписанием сотрудника.
+
+    Дежурства с интервалом — события со временем начала и конца (местное
+    время), остальные статусы — события на весь день, не занимающие время.
+
+    :param schedule: список (дата, статус, интервал), см. ScheduleIndex.employee_schedule
+    :param stamp: время данных для DTSTAMP (datetime в UTC)
+    """
+    name = employee.lstrip('@')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//duty-bot//schedule//RU',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f"X-WR-CALNAME:{_ics_text('Расписание ' + employee)}",
+    ]
+    seen = set()
+    for day, status, time_range in schedule:
+        summary = STATUS_MAPPING.get(status, status)
+        start, end = _shift_times(day, time_range) if status == 'duty' else (None, None)
+        if start is not None:
+            uid = f"{name}-{start:%Y%m%dT%H%M}-{status}"
+            period = [f"DTSTART:{start:%Y%m%dT%H%M%S}", f"DTEND:{end:%Y%m%dT%H%M%S}", 'TRANSP:OPAQUE']
+        else:
+            # Одинаковый статус в дневном и ночном интервалах — одно событие на день
+            if (day, status) in seen:
+                continue
+            seen.add((day, status))
+            uid = f"{name}-{day:%Y%m%d}-{status}"
+            period = [f"DTSTART;VALUE=DATE:{day:%Y%m%d}",
+                      f"DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}", 'TRANSP:TRANSPARENT']
+        lines += ['BEGIN:VEVENT', f"UID:{uid}@duty-bot", f"DTSTAMP:{stamp:%Y%m%dT%H%M%SZ}"]
+        lines += period
+        lines += [f"SUMMARY:{_ics_text(summary)}", 'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return ''.join(_ics_fold(line) + '\r\n' for line in lines)
+
+
+class ScheduleApi:
+    """
+    HTTP API только для чтения поверх индекса расписания в памяти бота.
+
+    - GET /api/duty/now — кто дежурит сейчас и следующее дежурство;
+    - GET /api/duty?at=YYYY-MM-DDTHH:MM — кто дежурит в момент at;
+    - GET /api/employees/<никнейм>?from=YYYY-MM-DD&to=YYYY-MM-DD — расписание сотрудника в JSON;
+    - GET /api/employees/<никнейм>.ics?from=...&to=... — то же в iCalendar.
+
+    ETag ответа строится из отпечатка данных (манифеста хранилища) и
+    параметров запроса ещё до чтения расписания, поэтому повторный опрос с
+    If-None-Match получает 304, не загружая месяцы из хранилища, а готовые
+    тела ответов берутся из кеша. Данные читаются только при рендере тела.
+
+    Каждый запрос передаёт токен в заголовке Authorization: Bearer. Параметр
+    ?token= оставлен только для календарных клиентов, которые не умеют
+    добавлять заголовки к подписке на .ics: токен в URL попадает в журналы
+    прокси и историю браузера, поэтому сервисам его передавать не следует.
+    """
+
+    def __init__(self, get_index, token):
+        """
+        :param get_index: функция, возвращающая текущий индекс расписания
+        :param token: токен, который запросы передают в Authorization: Bearer (или в ?token=, см. выше)
+        """
+        if not token:
+            raise ValueError("Для HTTP API расписания нужен токен")
+        self.get_index = get_index
+        self.token = token
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, prefix='/api'):
+        """Регистрирует маршруты во встроенном HTTP-сервере"""
+        route('GET', f"{prefix}/duty/now")(self._endpoint('duty_now', self.duty_now))
+        route('GET', f"{prefix}/duty")(self._endpoint('duty_at', self.duty_at))
+        self._employees_prefix = f"{prefix}/employees/"
+        route('GET', self._employees_prefix, prefix=True)(self._endpoint('employee', self.employee))
+        return self
+
+    def _endpoint(self, name, func):
+        """
+        Общая часть обработчиков: проверка токена, ошибки, ETag и кеш ответов.
+
+        func(request, index, params) возвращает (ключ ответа, Content-Type, функция рендера тела);
+        рендер вызывается, только если ответа нет в кеше, и может сам вызвать ApiError.
+        """
+        def handler(request):
+            status, headers, body = self._respond(request, func)
+            API_REQUESTS.inc(endpoint=name, status=status)
+            return status, headers, body
+        return handler
+
+    def _respond(self, request, func):
+        params = query_params(request)
+        try:
+            self._check_token(request, params)
+            index = self.get_index()
+            key, content_type, render = func(request, index, params)
+
+            # ETag выдаётся только с ответом 200, поэтому совпадение означает, что данные с тех пор не менялись
+            etag = _etag(index.signature, content_type, key)
+            headers = {'Content-Type': content_type, 'ETag': etag, 'Cache-Control': 'no-cache'}
+            if _etag_matches(request.headers.get('If-None-Match'), etag):
+                return 304, headers, b''
+
+            body = self._cache.get(etag)
+            if body is None:
+                body = render().encode('utf-8')
+                with self._lock:
+                    self._cache[etag] = body
+                    while len(self._cache) > RESPONSE_CACHE_SIZE:
+                        self._cache.popitem(last=False)
+        except ApiError as e:
+            body = json.dumps({'error': str(e)}, ensure_ascii=False).encode('utf-8')
+            return e.status, {'Content-Type': JSON_TYPE}, body
+        return 200, headers, body
+
+    def _check_token(self, request, params):
+        authorization = request.headers.get('Authorization', '')
+        supplied = authorization[7:] if authorization.startswith('Bearer ') else params.get('token', '')
+        # Байты, а не строки: compare_digest отвергает str с не-ASCII символами исключением
+        if not hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8')):
+            raise ApiError(401, "Нужен токен API")
+
+    def duty_now(self, request, index, params):
+        now = datetime.now()
+        on_duty = index.on_duty_at(now)
+        next_duty = index.next_duty(now)
+        # Ответ меняется только на границах смен, поэтому ключ — состав дежурных, а не текущее время
+        key = ('now', tuple(on_duty), next_duty and (next_duty[0], tuple(next_duty[1])))
+
+        def render():
+            return json.dumps({
+                'on_duty': on_duty,
+                'next': next_duty and {
+                    'start': next_duty[0].isoformat(),
+                    'shifts': [{'employee': employee, 'end': end.isoformat()} for employee, end in next_duty[1]],
+                },
+            }, ensure_ascii=False)
+        return key, JSON_TYPE, render
+
+    def duty_at(self, request, index, params):
+        if 'at' not in params:
+            raise ApiError(400, "Укажите момент времени: ?at=YYYY-MM-DDTHH:MM")
+        moment = _parse_moment(params['at'])
+
+        def render():
+            return json.dumps({'at': moment.isoformat(), 'on_duty': index.on_duty_at(moment)}, ensure_ascii=False)
+        return ('at', moment), JSON_TYPE, render
+
+    def employee(self, request, index, params):
+        name = unquote(urlsplit(request.path).path[len(self._employees_prefix):])
+        calendar = name.endswith('.ics')
+        if calendar:
+            name = name[:-len('.ics')]
+        if not name or '/' in name:
+            raise ApiError(404, "Сотрудник не указан")
+        employee = name if name.startswith('@') else f"@{name}"
+
+        start_date = _parse_date(params['from'], 'from') if 'from' in params else date.today()
+        end_date = (_parse_date(params['to'], 'to') if 'to' in params
+                    else start_date + timedelta(days=DEFAULT_RANGE_DAYS - 1))
+        if end_date < start_date or (end_date - start_date).days >= MAX_RANGE_DAYS:
+            raise ApiError(400, f"Период должен быть от 1 до {MAX_RANGE_DAYS} дней")
+
+        key = ('employee', employee, start_date, end_date)
+
+        def read_schedule():
+            # Старые месяцы читаются с диска, поэтому расписание берётся только при рендере
+            schedule = index.employee_schedule(employee, start_date, end_date)
+            if schedule is None:
+                raise ApiError(404, f"{employee} нет в расписании")
+            return schedule
+
+        if calendar:
+            stamp = datetime.fromtimestamp(index.signature[2] / 1e9 if index.signature else 0, timezone.utc)
+            return key, ICALENDAR_TYPE, lambda: render_icalendar(employee, read_schedule(), stamp)
+
+        def render():
+            schedule = read_schedule()
+            days = []
+            for day, status, time_range in schedule:
+                start, end = _shift_times(day, time_range)
+                days.append({
+                    'date': day.isoformat(),
+                    'status': status,
+                    'interval': time_range or None,
+                    'start': start and start.isoformat(),
+                    'end': end and end.isoformat(),
+                })
+            return json.dumps({
+                'employee': employee,
+                'from': start_date.isoformat(),
+                'to': end_date.isoformat(),
+                'days': days,
+            }, ensure_ascii=False)
+        return key, JSON_TYPE, render
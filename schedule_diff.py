@@ -0,0 +1,250 @@
+import hashlib
+import os
+import sqlite3
+from collections import namedtuple
+from itertools import groupby
+from operator import itemgetter
+
+from schedule_schema import STATUS_NAMES, WRITE_BATCH_SIZE, batched, format_interval
+
+# Изменение одной ячейки таблицы: статус сотрудника в интервале дня до и после обновления (None — ячейки нет)
+ScheduleChange = namedtuple('ScheduleChange', ['employee', 'date', 'start_min', 'end_min', 'old_status', 'new_status'])
+
+_DIGEST_MASK = (1 << 64) - 1
+
+# Отпечатки колонок (сотрудник) и ячеек (сотрудник, дата); сравниваются между снимками по имени сотрудника
+DIGEST_TABLES = [
+    """
+    CREATE TABLE column_digests (
+        employee TEXT PRIMARY KEY,
+        digest INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE cell_digests (
+        employee TEXT NOT NULL,
+        date TEXT NOT NULL,
+        digest INTEGER NOT NULL,
+        PRIMARY KEY (employee, date)
+    )
+    """,
+    """
+    CREATE TABLE changes (
+        employee TEXT NOT NULL,
+        date TEXT NOT NULL,
+        start_min INTEGER,
+        end_min INTEGER,
+        old_status INTEGER,
+        new_status INTEGER
+    )
+    """,
+]
+
+
+def _digest(*values):
+    data = '|'.join(map(str, values)).encode()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+def _signed(digest):
+    # SQLite хранит только знаковые 64-битные целые
+    return digest - (1 << 64) if digest >= 1 << 63 else digest
+
+
+# Смены по сотрудникам: порядок совпадает с индексом idx_shifts_employee_date, сортировка не нужна
+_SHIFTS_BY_EMPLOYEE = """
+    SELECT e.username, s.date, s.start_min, s.end_min, s.status
+    FROM shifts s JOIN employees e ON e.id = s.employee_id
+    {where}
+    ORDER BY s.employee_id, s.date
+"""
+
+
+def _employee_digests(rows):
+    """
+    Отпечатки одного сотрудника.
+
+    Отпечаток — сумма хешей записей по модулю 2^64, поэтому не зависит от
+    порядка строк в исходной таблице.
+
+    :param rows: строки (сотрудник, дата, start_min, end_min, статус) одного сотрудника
+    :return: (отпечаток колонки, {дата: отпечаток ячейки})
+    """
+    days = {}
+    for _, day, start_min, end_min, status in rows:
+        days[day] = (days.get(day, 0) + _digest(start_min, end_min, status)) & _DIGEST_MASK
+    column = 0
+    for day, digest in days.items():
+        column = (column + _digest(day, digest)) & _DIGEST_MASK
+    return _signed(column), {day: _signed(digest) for day, digest in days.items()}
+
+
+def iter_digests(conn):
+    """
+    Отпечатки колонок и ячеек по таблице shifts, сотрудник за сотрудником.
+
+    В памяти держатся ячейки только текущего сотрудника, поэтому расход
+    памяти не зависит от размера таблицы.
+
+    :return: генератор (сотрудник, отпечаток колонки, {дата: отпечаток ячейки})
+    """
+    rows = conn.execute(_SHIFTS_BY_EMPLOYEE.format(where=''))
+    for employee, employee_rows in groupby(rows, key=itemgetter(0)):
+        column, cells = _employee_digests(employee_rows)
+        yield employee, column, cells
+
+
+def write_digests(conn):
+    """Сохраняет отпечатки во только что собранную базу"""
+    for statement in DIGEST_TABLES:
+        conn.execute(statement)
+    # Фиксация одна, в конце: до Python 3.11 commit сбрасывает незавершённый SELECT
+    for employee, column, cells in iter_digests(conn):
+        conn.execute("INSERT INTO column_digests (employee, digest) VALUES (?, ?)", (employee, column))
+        conn.executemany(
+            "INSERT INTO cell_digests (employee, date, digest) VALUES (?, ?, ?)",
+            ((employee, day, digest) for day, digest in cells.items())
+        )
+    conn.commit()
+
+
+def write_changes(conn, changes):
+    """
+    Сохраняет изменения относительно предыдущего снимка, чтобы бот мог разослать уведомления.
+
+    :param changes: итератор ScheduleChange; пишется пачками, не накапливаясь в памяти
+    :return: количество изменений
+    """
+    count = 0
+    for batch in batched(changes, WRITE_BATCH_SIZE):
+        conn.executemany(
+            "INSERT INTO changes (employee, date, start_min, end_min, old_status, new_status) VALUES (?, ?, ?, ?, ?, ?)",
+            batch
+        )
+        count += len(batch)
+    conn.commit()
+    return count
+
+
+def recorded_changes(conn, limit=-1):
+    """Изменения, записанные в базу (не больше limit); статусы — имена из STATUS_CODES"""
+    rows = conn.execute("""
+        SELECT employee, date, start_min, end_min, old_status, new_status
+        FROM changes ORDER BY employee, date, start_min
+        LIMIT ?
+    """, (limit,))
+    return [
+        ScheduleChange(employee, day, start_min, end_min, STATUS_NAMES.get(old_status), STATUS_NAMES.get(new_status))
+        for employee, day, start_min, end_min, old_status, new_status in rows
+    ]
+
+
+def read_changes(db_path):
+    """Изменения, записанные при последнем обновлении раздела db_path"""
+    if not os.path.exists(db_path):
+        return []
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    try:
+        return recorded_changes(conn)
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+
+class _Snapshot:
+    """
+    Доступ к отпечаткам и сменам одной базы.
+
+    Для баз без отпечатков (собранных до их появления) отпечатки колонок
+    вычисляются одним проходом, а ячейки — по сотруднику, когда понадобятся.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self._has_digests = 'cell_digests' in tables
+        self._columns = None
+
+    def columns(self):
+        if self._has_digests:
+            return dict(self.conn.execute("SELECT employee, digest FROM column_digests"))
+        if self._columns is None:
+            self._columns = {employee: column for employee, column, _ in iter_digests(self.conn)}
+        return self._columns
+
+    def dates(self):
+        table = 'cell_digests' if self._has_digests else 'shifts'
+        return {row[0] for row in self.conn.execute(f"SELECT DISTINCT date FROM {table}")}
+
+    def cells(self, employee):
+        if self._has_digests:
+            return dict(self.conn.execute("SELECT date, digest FROM cell_digests WHERE employee = ?", (employee,)))
+        rows = self.conn.execute(_SHIFTS_BY_EMPLOYEE.format(where='WHERE e.username = ?'), (employee,))
+        return _employee_digests(rows)[1]
+
+    def shifts(self, employee, day):
+        rows = self.conn.execute("""
+            SELECT s.start_min, s.end_min, s.status
+            FROM shifts s JOIN employees e ON e.id = s.employee_id
+            WHERE e.username = ? AND s.date = ?
+        """, (employee, day))
+        return {(start_min, end_min): status for start_min, end_min, status in rows}
+
+
+def diff_snapshots(old_db, new_conn):
+    """
+    Поячеечная разница между прежней базой и новой.
+
+    Сначала сравниваются отпечатки колонок, и неизменившиеся сотрудники
+    пропускаются целиком; затем у изменившихся сравниваются отпечатки по
+    дням, и только для отличающихся дней читаются сами смены. Учитываются
+    только даты, которые есть в обоих снимках: появление нового месяца или
+    исчезновение прошедшего изменением не считается.
+
+    :param old_db: путь к прежней базе (если её нет, изменений нет)
+    :param new_conn: соединение с новой базой, в которой уже записаны отпечатки
+    :return: генератор ScheduleChange со статусами в виде кодов
+    """
+    if not os.path.exists(old_db):
+        return
+    old_conn = sqlite3.connect(f"file:{os.path.abspath(old_db)}?mode=ro", uri=True)
+    try:
+        old, new = _Snapshot(old_conn), _Snapshot(new_conn)
+        try:
+            old_columns = old.columns()
+        except sqlite3.OperationalError:
+            # Прежняя база старого формата без таблицы shifts
+            return
+        new_columns = new.columns()
+        common_dates = old.dates() & new.dates()
+        for employee in sorted(set(old_columns) | set(new_columns)):
+            if old_columns.get(employee) == new_columns.get(employee):
+                continue
+            old_cells = old.cells(employee) if employee in old_columns else {}
+            new_cells = new.cells(employee) if employee in new_columns else {}
+            for day in sorted((set(old_cells) | set(new_cells)) & common_dates):
+                if old_cells.get(day) == new_cells.get(day):
+                    continue
+                old_shifts = old.shifts(employee, day) if day in old_cells else {}
+                new_shifts = new.shifts(employee, day) if day in new_cells else {}
+                for start_min, end_min in sorted(set(old_shifts) | set(new_shifts), key=_interval_order):
+                    old_status = old_shifts.get((start_min, end_min))
+                    new_status = new_shifts.get((start_min, end_min))
+                    if old_status != new_status:
+                        yield ScheduleChange(employee, day, start_min, end_min, old_status, new_status)
+    finally:
+        old_conn.close()
+
+
+def _interval_order(interval):
+    """Ключ сортировки интервалов; нераспознанный интервал (None, None) идёт первым"""
+    start_min, end_min = interval
+    return (start_min is not None, start_min or 0, end_min or 0)
+
+
+def describe_change(change):
+    """Строка вида «@user 2024-10-15 09:00-21:00: work → duty» для отчёта загрузки"""
+    where = ' '.join(filter(None, [change.employee, change.date, format_interval(change.start_min, change.end_min)]))
+    return (f"{where}: {STATUS_NAMES.get(change.old_status, change.old_status)} → "
+            f"{STATUS_NAMES.get(change.new_status, change.new_status)}")
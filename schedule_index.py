@@ -0,0 +1,395 @@
+import itertools
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+from db_pool import get_pool
+from schedule_schema import MINUTES_PER_DAY, STATUS_NAMES, format_interval
+from schedule_snapshot import Snapshot, snapshot_path
+from schedule_store import ScheduleStore, month_of
+
+# Сколько прошлых месяцев (раньше предыдущего) держать в памяти после обращения к ним
+HISTORY_MONTHS = int(os.getenv('SCHEDULE_HISTORY_MONTHS', '3'))
+
+
+class ScheduleIndex:
+    """
+    Неизменяемый индекс расписания, построенный один раз из хранилища.
+
+    Дежурства хранятся на общей шкале минут (date.toordinal() * 1440 + минуты),
+    разбитой на отрезки с постоянным составом дежурных, поэтому
+    «кто дежурит в момент T» и «кто дежурит следующим» — двоичный поиск.
+
+    by_employee[сотрудник][дата] = [(статус, интервал), ...]
+    """
+
+    def __init__(self, duty_shifts, by_employee, signature=None):
+        """
+        :param duty_shifts: список (начало, конец, сотрудник) в абсолютных минутах
+        :param by_employee: расписание по сотрудникам
+        """
+        self.by_employee = by_employee
+        self.signature = signature
+        self.version = next(_versions)
+        self.dates = frozenset(day for days in by_employee.values() for day in days)
+
+        # Отпечатки расписаний сотрудников: по ним кеши узнают, чьи данные изменились
+        self.fingerprints = {
+            employee: hash(tuple((day, tuple(entries)) for day, entries in sorted(days.items())))
+            for employee, days in by_employee.items()
+        }
+
+        # Начала смен: _starts[i] -> [(сотрудник, конец), ...]
+        starts = defaultdict(list)
+        for start, end, employee in duty_shifts:
+            starts[start].append((employee, end))
+        self._start_points = sorted(starts)
+        self._starts = [starts[point] for point in self._start_points]
+
+        # Отрезки шкалы: на [_boundaries[i], _boundaries[i + 1]) дежурят _segments[i]
+        events = defaultdict(list)
+        for start, end, employee in duty_shifts:
+            events[start].append((employee, 1))
+            events[end].append((employee, -1))
+        self._boundaries = sorted(events)
+        self._segments = []
+        active = defaultdict(int)
+        for point in self._boundaries:
+            for employee, delta in events[point]:
+                active[employee] += delta
+                if not active[employee]:
+                    del active[employee]
+            self._segments.append(tuple(active))
+
+    @classmethod
+    def from_rows(cls, rows, signature=None):
+        """
+        Строит индекс из смен, упорядоченных по (дата, начало, конец).
+
+        :param rows: итератор (дата, start_min, end_min, имя статуса, сотрудник)
+        """
+        duty_shifts = []
+        by_employee = defaultdict(lambda: defaultdict(list))
+        for day, start_min, end_min, status, employee in rows:
+            by_employee[employee][day].append((status, format_interval(start_min, end_min)))
+            if status == 'duty' and start_min is not None and end_min is not None:
+                # Базы, собранные до нормализации ночных смен, хранят конец <= начала
+                if end_min <= start_min:
+                    end_min += MINUTES_PER_DAY
+                base = day.toordinal() * MINUTES_PER_DAY
+                duty_shifts.append((base + start_min, base + end_min, employee))
+
+        return cls(
+            duty_shifts,
+            {employee: dict(days) for employee, days in by_employee.items()},
+            signature,
+        )
+
+    @classmethod
+    def from_partitions(cls, db_paths, signature=None):
+        """
+        Общий индекс по разделам хранилища (см. schedule_store).
+
+        Каждый раздел читается из свежего снимка, а если его нет — из SQLite.
+
+        :param signature: отпечаток хранилища
+        """
+        rows = []
+        for db_path in db_paths:
+            rows.extend(_partition_rows(db_path))
+        return cls.from_rows(rows, signature)
+
+    def on_duty_at(self, moment):
+        """Список дежурных в момент moment (datetime)"""
+        i = bisect_right(self._boundaries, _to_minutes(moment)) - 1
+        if i < 0:
+            return []
+        return list(self._segments[i])
+
+    def next_duty(self, moment):
+        """
+        Ближайшее начало дежурства строго после moment.
+
+        :return: (начало, [(сотрудник, конец), ...]) или None, если дежурств больше нет
+        """
+        i = bisect_right(self._start_points, _to_minutes(moment))
+        if i >= len(self._start_points):
+            return None
+        return (
+            _from_minutes(self._start_points[i]),
+            [(employee, _from_minutes(end)) for employee, end in self._starts[i]],
+        )
+
+    def duty_starts_after(self, moment):
+        """Начала дежурств строго после moment по порядку: (начало, [(сотрудник, конец), ...])"""
+        i = bisect_right(self._start_points, _to_minutes(moment))
+        for point, shifts in zip(self._start_points[i:], self._starts[i:]):
+            yield _from_minutes(point), [(employee, _from_minutes(end)) for employee, end in shifts]
+
+    def employee_schedule(self, employee, start_date, end_date):
+        """
+        Расписание сотрудника с start_date по end_date включительно.
+
+        :return: список (дата, статус, интервал) или None, если сотрудника нет в расписании
+        """
+        days = self.by_employee.get(employee)
+        if days is None:
+            return None
+        result = []
+        day = start_date
+        while day <= end_date:
+            for status, time_range in days.get(day, ()):
+                result.append((day, status, time_range))
+            day += timedelta(days=1)
+        return result
+
+    def indexes(self, start_date, end_date=None):
+        """Индексы месяцев, пересекающихся с периодом; здесь весь индекс один"""
+        return [(None, self)]
+
+
+class PartitionedScheduleIndex:
+    """
+    Индекс хранилища, разбитого по месяцам (см. schedule_store).
+
+    Для каждого месяца строится отдельный ScheduleIndex по разделам всех
+    команд, а запросы расходятся только по месяцам, которые затрагивают.
+    Предыдущий, текущий и будущие месяцы загружаются сразу; более старые —
+    при первом обращении, и в памяти остаются не больше history_months
+    из них. Месяцы, которые нужны одному запросу, друг друга не вытесняют:
+    запрос за длинный период временно держит в памяти все свои месяцы. Индексы месяцев, разделы которых не изменились, переходят из
+    предыдущего индекса хранилища, поэтому кеши по ним остаются тёплыми.
+    """
+
+    def __init__(self, store, signature=None, previous=None, history_months=HISTORY_MONTHS, today=None):
+        """
+        :param store: хранилище (ScheduleStore)
+        :param signature: отпечаток хранилища
+        :param previous: предыдущий индекс хранилища, из которого берутся неизменившиеся месяцы
+        """
+        self.signature = signature
+        self.version = next(_versions)
+        self.history_months = history_months
+
+        partitions = defaultdict(list)
+        for _, month, db_path in store.partitions():
+            partitions[month].append(db_path)
+        self.months = sorted(partitions)
+        self._partitions = {month: tuple(db_paths) for month, db_paths in partitions.items()}
+        self._signatures = {month: tuple(_file_signature(db_path) for db_path in db_paths)
+                            for month, db_paths in self._partitions.items()}
+
+        self._lock = threading.Lock()
+        self._history = OrderedDict()
+        self._pinned = {}
+        recent = month_of(_previous_month(today or date.today()).isoformat())
+        for month in self.months:
+            index = previous._reusable(month, self._signatures[month]) if previous is not None else None
+            if month >= recent:
+                self._pinned[month] = index or self._load(month)
+            elif index is not None:
+                self._history[month] = index
+        while len(self._history) > self.history_months:
+            self._history.popitem(last=False)
+
+    def _reusable(self, month, signatures):
+        """Индекс месяца, если он уже загружен и разделы месяца не изменились"""
+        if self._signatures.get(month) != signatures:
+            return None
+        with self._lock:
+            return self._pinned.get(month) or self._history.get(month)
+
+    def _load(self, month):
+        return ScheduleIndex.from_partitions(self._partitions[month], self._signatures[month])
+
+    def month_index(self, month):
+        """Индекс месяца 'YYYY-MM' или None, если месяца нет в хранилище"""
+        index = self._pinned.get(month)
+        if index is not None or month not in self._partitions:
+            return index
+        return self._history_indexes([month])[0]
+
+    def _history_indexes(self, months):
+        """Индексы старых месяцев одного запроса; при вытеснении они пропускаются"""
+        with self._lock:
+            result = []
+            for month in months:
+                index = self._history.get(month)
+                if index is None:
+                    index = self._history[month] = self._load(month)
+                else:
+                    self._history.move_to_end(month)
+                result.append(index)
+            for month in list(self._history):
+                if len(self._history) <= self.history_months:
+                    break
+                if month not in months:
+                    del self._history[month]
+            return result
+
+    def indexes(self, start_date, end_date=None):
+        """
+        Индексы месяцев, пересекающихся с периодом с start_date по end_date включительно.
+
+        :param end_date: конец периода (None — все следующие месяцы)
+        :return: список (месяц, ScheduleIndex) по порядку месяцев
+        """
+        first = month_of(start_date.isoformat())
+        last = month_of(end_date.isoformat()) if end_date is not None else None
+        months = [month for month in self.months if month >= first and (last is None or month <= last)]
+        history = [month for month in months if month not in self._pinned]
+        loaded = dict(zip(history, self._history_indexes(history))) if history else {}
+        return [(month, self._pinned[month] if month in self._pinned else loaded[month]) for month in months]
+
+    def loaded_months(self):
+        """Месяцы, индексы которых сейчас в памяти"""
+        with self._lock:
+            return sorted(list(self._pinned) + list(self._history))
+
+    def has_day(self, day):
+        """Есть ли в хранилище расписание на день"""
+        index = self.month_index(month_of(day.isoformat()))
+        return index is not None and day in index.dates
+
+    def on_duty_at(self, moment):
+        """Список дежурных в момент moment; ночная смена последнего дня месяца лежит в предыдущем месяце"""
+        on_duty = []
+        for _, index in self.indexes(_previous_month(moment.date()), moment.date()):
+            for employee in index.on_duty_at(moment):
+                if employee not in on_duty:
+                    on_duty.append(employee)
+        return on_duty
+
+    def next_duty(self, moment):
+        """См. ScheduleIndex.next_duty; месяцы просматриваются по порядку до первого дежурства"""
+        for _, index in self.indexes(moment.date()):
+            next_duty = index.next_duty(moment)
+            if next_duty is not None:
+                return next_duty
+        return None
+
+    def duty_starts_after(self, moment):
+        """См. ScheduleIndex.duty_starts_after"""
+        for _, index in self.indexes(moment.date()):
+            yield from index.duty_starts_after(moment)
+
+    def employee_schedule(self, employee, start_date, end_date):
+        """См. ScheduleIndex.employee_schedule"""
+        result = None
+        for _, index in self.indexes(start_date, end_date):
+            schedule = index.employee_schedule(employee, start_date, end_date)
+            if schedule is not None:
+                result = (result or []) + schedule
+        return result
+
+
+def _previous_month(day):
+    """Последний день предыдущего месяца"""
+    return day.replace(day=1) - timedelta(days=1)
+
+
+def _to_minutes(moment):
+    """datetime -> абсолютные минуты"""
+    return moment.toordinal() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def _from_minutes(minutes):
+    """Абсолютные минуты -> datetime"""
+    day, minute = divmod(minutes, MINUTES_PER_DAY)
+    return datetime.combine(date.fromordinal(day), datetime.min.time()) + timedelta(minutes=minute)
+
+
+def _file_signature(path):
+    """Отпечаток файла БД: меняется при любой перезаписи или подмене файла"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _db_rows(db_path):
+    """Смены из базы SQLite в формате from_rows"""
+    # Соединение берётся из общего read-only пула
+    with get_pool(db_path).connection() as conn:
+        cursor = conn.execute("""
+        SELECT s.date, s.start_min, s.end_min, st.name, e.username
+        FROM shifts s
+        JOIN employees e ON e.id = s.employee_id
+        JOIN statuses st ON st.code = s.status
+        ORDER BY s.date, s.start_min, s.end_min
+        """)
+        return [(date.fromisoformat(date_iso), start_min, end_min, status, employee)
+                for date_iso, start_min, end_min, status, employee in cursor]
+
+
+def _snapshot_rows(snapshot_file):
+    """Смены из бинарного снимка в формате from_rows"""
+    days = {}
+    rows = []
+    with Snapshot(snapshot_file) as snapshot:
+        for ordinal, start_min, end_min, code, employee in snapshot.rows():
+            day = days.get(ordinal)
+            if day is None:
+                day = days[ordinal] = date.fromordinal(ordinal)
+            rows.append((day, start_min, end_min, STATUS_NAMES[code], employee))
+    return rows
+
+
+def _snapshot_is_fresh(db_path, signature):
+    """
+    Снимок пишется сразу после подмены базы, поэтому он соответствует ей,
+    только если изменён не раньше базы. Иначе (снимок отключён, не дописан
+    или остался от прошлой загрузки) смены читаются из SQLite.
+    """
+    signature_snapshot = _file_signature(snapshot_path(db_path))
+    return signature_snapshot is not None and signature_snapshot[2] >= signature[2]
+
+
+def _partition_rows(db_path):
+    """Смены раздела из свежего снимка, а если его нет или он повреждён — из SQLite"""
+    signature = _file_signature(db_path)
+    if signature is None:
+        return []
+    if _snapshot_is_fresh(db_path, signature):
+        try:
+            return _snapshot_rows(snapshot_path(db_path))
+        except (OSError, ValueError):
+            pass
+    return _db_rows(db_path)
+
+
+_versions = itertools.count()
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_schedule_index(store_dir):
+    """
+    Возвращает текущий индекс расписания по всем командам.
+
+    Индекс перестраивается, только если изменился манифест хранилища; новый
+    индекс подменяется одним присваиванием, поэтому читатели никогда не видят
+    частично построенных данных.
+    """
+    index = _index
+    if index is not None and index.signature == ScheduleStore(store_dir).signature():
+        return index
+    return reload_schedule_index(store_dir)
+
+
+def reload_schedule_index(store_dir):
+    """
+    Принудительно перестраивает индекс хранилища и атомарно подменяет текущий.
+
+    Неизменившиеся месяцы берутся из текущего индекса без повторного чтения.
+    """
+    global _index
+    with _index_lock:
+        store = ScheduleStore(store_dir)
+        signature = store.signature()
+        if _index is not None and _index.signature == signature:
+            return _index
+        _index = PartitionedScheduleIndex(store, signature, previous=_index)
+        return _index
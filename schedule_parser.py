@@ -0,0 +1,418 @@
+import codecs
+import csv
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import INGEST_STAGE_DURATION
+from schedule_diff import describe_change, diff_snapshots, recorded_changes, write_changes, write_digests
+from schedule_schema import (STATUS_CODES, STATUS_NAMES, WRITE_BATCH_SIZE, ShiftWriter, batched, format_interval,
+                             parse_interval, write_meta)
+from schedule_snapshot import SnapshotWriter
+
+# Таймаут HTTP-запроса к таблице, секунды
+REQUEST_TIMEOUT = 60
+
+# Повторы GET при сетевых ошибках и ответах 429/5xx с экспоненциальной паузой
+FETCH_RETRIES = 3
+FETCH_BACKOFF = 0.5
+
+# Размер куска при потоковом чтении ответа
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Сколько изменённых ячеек выводить в отчёте загрузки
+REPORTED_CHANGES = 20
+
+STATUS_MAPPING = {
+    'р': 'work',
+    'о': 'vacation',
+    '+': 'duty',
+    'в': 'dayoff'
+}
+
+# Символ статуса в таблице -> код статуса в базе
+GLYPH_CODES = {glyph: STATUS_CODES[status] for glyph, status in STATUS_MAPPING.items()}
+
+MONTH_MAPPING = {
+    'янв': '01',
+    'фев': '02',
+    'мар': '03',
+    'апр': '04',
+    'май': '05',
+    'мая': '05',  # «1 мая»: первые три буквы родительного падежа
+    'июн': '06',
+    'июл': '07',
+    'авг': '08',
+    'сен': '09',
+    'окт': '10',
+    'ноя': '11',
+    'дек': '12'
+}
+
+# Окно, в которое попадает первая дата таблицы без года: до 3 месяцев вперёд и до 9 назад
+FUTURE_SHEET_DAYS = 92
+PAST_SHEET_DAYS = 273
+
+
+def parse_day_month(rus_date):
+    """День и месяц из даты таблицы: «пн, 1 октября» -> (1, 10)"""
+    parts = rus_date.split(', ')
+    day = parts[1].split(' ')[0]
+    month_cyr = parts[1].split(' ')[1][:3]  # Учитываем только первые 3 символа
+
+    month = MONTH_MAPPING.get(month_cyr)
+    if not month:
+        raise ValueError(f"Unknown month abbreviation: {month_cyr}")
+    return int(day), int(month)
+
+
+class DateResolver:
+    """
+    Даты таблицы в формате YYYY-MM-DD с выводом года, которого в таблице нет.
+
+    Первая дата таблицы относится к году, при котором она попадает в окно
+    от 9 месяцев назад до 3 месяцев вперёд от today: декабрьская таблица,
+    прочитанная в январе, относится к прошлому году, а январская, прочитанная
+    в октябре, — к следующему. Дальше даты идут по порядку, и переход
+    с декабря на январь внутри таблицы увеличивает год.
+    """
+
+    def __init__(self, today=None):
+        self.today = today or date.today()
+        self._previous = None
+        self._resolved = {}
+
+    def __call__(self, rus_date):
+        iso_date = self._resolved.get(rus_date)
+        if iso_date is None:
+            iso_date = self._resolved[rus_date] = self._resolve(rus_date)
+        return iso_date
+
+    def _resolve(self, rus_date):
+        day, month = parse_day_month(rus_date)
+        if self._previous is None:
+            year = self._first_year(day, month)
+        else:
+            previous_year, previous_month = self._previous
+            year = previous_year + 1 if month < previous_month else previous_year
+        try:
+            resolved = date(year, month, day)
+        except ValueError:
+            raise ValueError(f"Некорректная дата в таблице: {rus_date} ({year})") from None
+        self._previous = (year, month)
+        return resolved.isoformat()
+
+    def _first_year(self, day, month):
+        year = self.today.year
+        # 29 февраля сравнивается как 28-е, чтобы дата существовала в любом году
+        first = date(year, month, min(day, 28) if month == 2 else day)
+        if first > self.today + timedelta(days=FUTURE_SHEET_DAYS):
+            return year - 1
+        if first <= self.today - timedelta(days=PAST_SHEET_DAYS):
+            return year + 1
+        return year
+
+
+def create_session(pool_size=10):
+    """
+    Общая сессия для загрузки таблиц: соединения с сервером переиспользуются
+    (keep-alive), а сбои сети и ответы 429/5xx повторяются с паузой.
+
+    :param pool_size: сколько соединений к одному хосту держать открытыми
+    """
+    retry = Retry(
+        total=FETCH_RETRIES,
+        backoff_factor=FETCH_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_csv(csv_url, headers=None, stream=False, session=None):
+    """GET таблицы; ответ нужно закрыть (with fetch_csv(...) as response)"""
+    if not csv_url:
+        raise ValueError("URL не найден в .env файле!")
+    return (session or requests).get(csv_url, headers=headers or {}, timeout=REQUEST_TIMEOUT, stream=stream)
+
+
+def iter_text_lines(chunks, hasher=None):
+    """Декодирует поток байтов в строки, попутно считая хеш содержимого"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    tail = ''
+    for chunk in chunks:
+        if hasher is not None:
+            hasher.update(chunk)
+        lines = (tail + decoder.decode(chunk)).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_csv_records(rows, head_mapping=None, stats=None, today=None):
+    """
+    Построчно разворачивает строки CSV в записи смен.
+
+    Колонки с пустым заголовком отбрасываются, дата протягивается вниз до
+    следующей заполненной, а строки после последней даты не попадают в
+    расписание.
+
+    :param rows: итератор строк csv.reader, первая строка — заголовок
+    :param head_mapping: переименование колонок сотрудников (HEAD_MAPPING)
+    :param stats: словарь, куда записываются число строк и колонок таблицы и нераспознанные статусы
+    :param today: дата, относительно которой выводится год (см. DateResolver)
+    :return: генератор (ISO дата, сотрудник, код статуса, start_min, end_min)
+    """
+    head_mapping = head_mapping or {}
+    resolve_date = DateResolver(today)
+    header = next(rows, None)
+    if header is None:
+        raise ValueError("Таблица пуста")
+    keep = [i for i, name in enumerate(header) if name != '']
+    date_idx, time_idx = keep[0], keep[1]
+    employees = [(head_mapping.get(header[i], header[i]), i) for i in keep[2:]]
+    width = len(header)
+
+    unknown = {}
+
+    def row_records(row, day):
+        start_min, end_min = parse_interval(row[time_idx])
+        for employee, i in employees:
+            value = row[i]
+            if value == '':
+                continue
+            code = GLYPH_CODES.get(value.strip())
+            if code is None:
+                unknown[value] = unknown.get(value, 0) + 1
+                continue
+            yield day, employee, code, start_min, end_min
+
+    count = 0
+    current_date = None
+    pending = []  # строки после последней встреченной даты
+    for row in rows:
+        if not row:
+            continue
+        if len(row) < width:
+            row += [''] * (width - len(row))
+        if row[date_idx]:
+            for pending_row in pending:
+                yield from row_records(pending_row, current_date)
+            count += len(pending)
+            pending = []
+            current_date = resolve_date(row[date_idx])
+            count += 1
+            yield from row_records(row, current_date)
+        elif current_date is not None:
+            pending.append(row)
+
+    if stats is not None:
+        stats['rows'] = count
+        stats['columns'] = len(keep)
+        stats['unknown'] = unknown
+
+
+def parse_sheet(content, head_mapping=None, today=None):
+    """
+    Разбирает таблицу целиком и возвращает готовый список записей.
+
+    Длительность этапов parse (чтение CSV) и transform (разворот в записи
+    смен) возвращается в статистике как parse_seconds и transform_seconds,
+    в метрики её переносит observe_parse_stages.
+
+    :return: (список записей смен, статистика как у iter_csv_records)
+    """
+    stats = {}
+    started = time.perf_counter()
+    rows = list(csv.reader(iter_text_lines([content])))
+    parsed = time.perf_counter()
+    records = list(iter_csv_records(iter(rows), head_mapping, stats, today))
+    stats['parse_seconds'] = parsed - started
+    stats['transform_seconds'] = time.perf_counter() - parsed
+    return records, stats
+
+
+def observe_parse_stages(stats):
+    """Переносит длительности этапов из статистики parse_sheet в метрики"""
+    INGEST_STAGE_DURATION.observe(stats['parse_seconds'], stage='parse')
+    INGEST_STAGE_DURATION.observe(stats['transform_seconds'], stage='transform')
+
+
+class SqliteSink:
+    """
+    Нормализованная база SQLite.
+
+    Собирается во временном файле рядом с основной; при commit в неё
+    записываются meta, отпечатки и изменения относительно текущей базы,
+    после чего она атомарно подменяет основную.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.tmp_path = db_path + '.tmp'
+        self._conn = None
+        self._writer = None
+
+    def open(self):
+        # Остатки прошлого запуска удаляются
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self._conn = sqlite3.connect(self.tmp_path)
+        self._writer = ShiftWriter(self._conn)
+
+    def write(self, batch):
+        self._writer.add(batch)
+
+    def commit(self, meta):
+        try:
+            self._writer.finish()
+            write_meta(self._conn, meta)
+            self._record_changes()
+        finally:
+            self._conn.close()
+        os.replace(self.tmp_path, self.db_path)
+
+    def abort(self):
+        if self._conn is not None:
+            self._conn.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def _record_changes(self):
+        """Отпечатки ячеек новой базы и изменения относительно текущей"""
+        with INGEST_STAGE_DURATION.time(stage='diff'):
+            write_digests(self._conn)
+            count = write_changes(self._conn, diff_snapshots(self.db_path, self._conn))
+
+        lines = [f"Изменено ячеек в {self.db_path}: {count}"]
+        lines += ["  " + describe_change(change) for change in recorded_changes(self._conn, REPORTED_CHANGES)]
+        if count > REPORTED_CHANGES:
+            lines.append(f"  ... и ещё {count - REPORTED_CHANGES}")
+        logging.info('\n'.join(lines))
+
+
+class JsonSink:
+    """
+    Расписание в JSON в прежнем формате schedule_processor.py:
+    {дата: [{сотрудник: {"статус": "..."}}, ...]}
+    """
+
+    STATUS_TEXT = {
+        'work': "работает",
+        'dayoff': "выходной",
+        'vacation': "в отпуске",
+        'duty': "дежурит {interval}",
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self._schedule = {}
+
+    def open(self):
+        self._schedule = {}
+
+    def write(self, batch):
+        for day, employee, code, start_min, end_min in batch:
+            text = self.STATUS_TEXT[STATUS_NAMES[code]].format(interval=format_interval(start_min, end_min))
+            self._schedule.setdefault(day, []).append({employee: {"статус": text}})
+
+    def commit(self, meta):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as json_file:
+            json.dump(self._schedule, json_file, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def abort(self):
+        self._schedule = {}
+
+
+class SnapshotSink:
+    """
+    Бинарный колоночный снимок (см. schedule_snapshot), который бот
+    отображает в память при старте вместо чтения SQLite.
+
+    Записи пишутся по дням во временные файлы колонок, поэтому в памяти
+    держится только текущий день, в том числе в потоковом режиме.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+        self._days = {}
+
+    def open(self):
+        self._writer = SnapshotWriter(self.path)
+        self._days = {}
+
+    def write(self, batch):
+        for day, employee, code, start_min, end_min in batch:
+            ordinal = self._days.get(day)
+            if ordinal is None:
+                ordinal = self._days[day] = date.fromisoformat(day).toordinal()
+            self._writer.add(employee, ordinal, start_min, end_min, code)
+
+    def commit(self, meta):
+        self._writer.finish()
+        self._writer = None
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+
+
+def run_pipeline(records, sinks, batch_size=WRITE_BATCH_SIZE):
+    """
+    Раздаёт записи смен пачками во все приёмники.
+
+    Приёмники открываются до разбора; при ошибке все они откатываются.
+    Фиксацию (commit) выполняет вызывающий код, когда решит, что данные
+    нужно сохранить.
+
+    :return: количество записей
+    """
+    for sink in sinks:
+        sink.open()
+    count = 0
+    try:
+        for batch in batched(records, batch_size):
+            for sink in sinks:
+                sink.write(batch)
+            count += len(batch)
+    except Exception:
+        abort_sinks(sinks)
+        raise
+    return count
+
+
+def commit_sinks(sinks, meta):
+    """Фиксирует приёмники по порядку; при ошибке незафиксированные откатываются"""
+    for i, sink in enumerate(sinks):
+        try:
+            sink.commit(meta)
+        except Exception:
+            abort_sinks(sinks[i:])
+            raise
+
+
+def abort_sinks(sinks):
+    for sink in sinks:
+        try:
+            sink.abort()
+        except Exception as e:
+            logging.warning(f"Не удалось откатить {type(sink).__name__}: {e}")
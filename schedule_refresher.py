@@ -0,0 +1,98 @@
+import logging
+import threading
+from datetime import datetime
+
+
+class ScheduleRefresher:
+    """
+    Фоновое обновление расписания внутри процесса бота.
+
+    Обновление выполняется в отдельном потоке по таймеру и по запросу.
+    Запросы, пришедшие во время обновления, присоединяются к нему,
+    а не запускают ещё одно.
+    """
+
+    def __init__(self, refresh_func, interval=None, on_refreshed=None):
+        """
+        :param refresh_func: функция обновления, возвращает истинное значение, если данные изменились
+        :param interval: период автоматического обновления в секундах (None или 0 — только по запросу)
+        :param on_refreshed: вызывается после обновления, изменившего данные, с результатом refresh_func
+        """
+        self.refresh_func = refresh_func
+        self.interval = interval or None
+        self.on_refreshed = on_refreshed
+
+        self.running = False
+        self.last_started = None
+        self.last_finished = None
+        self.last_changed = None
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._callbacks = []
+        self._thread = None
+
+    def start(self):
+        """Запускает рабочий поток"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='schedule-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def trigger(self, on_done=None):
+        """
+        Запрашивает обновление и сразу возвращает управление.
+
+        :param on_done: вызывается по завершении обновления с аргументами (changed, error)
+        :return: 'running', если обновление уже идёт и запрос присоединён к нему, иначе 'queued'
+        """
+        with self._lock:
+            if on_done is not None:
+                self._callbacks.append(on_done)
+            if self.running:
+                return 'running'
+            self._wakeup.set()
+            return 'queued'
+
+    def status(self):
+        """Текстовое описание состояния для ответа пользователю"""
+        if self.running:
+            return f"Обновление выполняется с {self.last_started:%H:%M:%S}"
+        if self.last_finished is None:
+            return "Обновление ещё не выполнялось"
+        if self.last_error is not None:
+            return f"Последнее обновление {self.last_finished:%d.%m.%Y %H:%M:%S} завершилось ошибкой: {self.last_error}"
+        result = "данные обновлены" if self.last_changed else "изменений нет"
+        return f"Последнее обновление {self.last_finished:%d.%m.%Y %H:%M:%S}: {result}"
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            with self._lock:
+                self._wakeup.clear()
+                self.running = True
+                self.last_started = datetime.now()
+
+            changed, error = False, None
+            try:
+                result = self.refresh_func()
+                changed = bool(result)
+                if changed and self.on_refreshed is not None:
+                    self.on_refreshed(result)
+            except Exception as e:
+                error = e
+                logging.error(f"Schedule refresh failed: {e}")
+
+            with self._lock:
+                self.running = False
+                self.last_finished = datetime.now()
+                self.last_changed = changed
+                self.last_error = error
+                callbacks, self._callbacks = self._callbacks, []
+
+            for callback in callbacks:
+                try:
+                    callback(changed, error)
+                except Exception as e:
+                    logging.error(f"Schedule refresh callback failed: {e}")
@@ -0,0 +1,112 @@
+import re
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+# Словарь статусов с переводами и эмодзи
+STATUS_MAPPING = {
+    'work': 'Рабочий день 👨🏻‍💻',
+    'dayoff': 'Выходной 🌴',
+    'vacation': 'Отпуск ✈️',
+    'duty': 'Дежурный 🚨'
+}
+
+WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+# Экранирование для MarkdownV2
+SPECIAL_CHARS = r"_\*\[\]\(\)~`>#+\-=|{}\."
+_ESCAPE_RE = re.compile(f'([{SPECIAL_CHARS}])')
+
+
+def escape_markdown(text):
+    """Экранирование специальных символов для MarkdownV2"""
+    return _ESCAPE_RE.sub(r'\\\1', text)
+
+
+def get_weekday(day):
+    """Возвращает день недели для даты"""
+    return WEEKDAYS[day.weekday()]
+
+
+TODAY_MARKER = escape_markdown(" 👈 Сегодня")
+
+
+def render_day(day, entries):
+    """
+    Строки MarkdownV2 для одного дня сотрудника, без отметки «Сегодня».
+
+    :param entries: список (статус, интервал) за день
+    """
+    date_part = f"*{escape_markdown(day.strftime('%d.%m.%Y'))}* \\({escape_markdown(get_weekday(day))}\\) \\- "
+    lines = []
+    for status, time_range in entries:
+        formatted_status = escape_markdown(STATUS_MAPPING.get(status, status))
+        if status == 'duty':
+            lines.append(f"{date_part}{formatted_status} {escape_markdown(time_range)}")
+        else:
+            lines.append(f"{date_part}{formatted_status}")
+    return lines
+
+
+class ScheduleRenderCache:
+    """
+    Кеш уже экранированных строк расписания по ключу (сотрудник, дата).
+
+    Строки хранятся отдельно для каждого месяца индекса. При смене индекса
+    месяца сбрасываются только строки сотрудников, чьи данные изменились
+    (по отпечаткам ScheduleIndex.fingerprints); в кеше остаются не больше
+    max_months последних использованных месяцев.
+    """
+
+    def __init__(self, max_months=6):
+        self.max_months = max_months
+        self._lock = threading.Lock()
+        # Месяц -> (версия индекса месяца, отпечатки сотрудников, строки); значения подменяются целиком
+        self._months = OrderedDict()
+
+    def _sync(self, month, index):
+        with self._lock:
+            version, fingerprints, lines = self._months.get(month, (-1, {}, {}))
+            if index.version > version:
+                changed = {employee for employee, fingerprint in fingerprints.items()
+                           if index.fingerprints.get(employee) != fingerprint}
+                if changed:
+                    lines = {key: value for key, value in lines.items() if key[0] not in changed}
+                self._months[month] = (index.version, index.fingerprints, lines)
+            self._months.move_to_end(month)
+            while len(self._months) > self.max_months:
+                self._months.popitem(last=False)
+            return self._months[month]
+
+    def render(self, index, employee, start_date, end_date, today):
+        """
+        Строки расписания сотрудника с start_date по end_date включительно.
+
+        :param index: индекс расписания (ScheduleIndex или PartitionedScheduleIndex)
+        :return: список строк или None, если сотрудника нет в расписании
+        """
+        result = None
+        for month, month_index in index.indexes(start_date, end_date):
+            days = month_index.by_employee.get(employee)
+            if days is None:
+                continue
+            if result is None:
+                result = []
+
+            state = self._months.get(month)
+            if state is None or state[0] != month_index.version:
+                state = self._sync(month, month_index)
+            # Индекс устарел, пока шёл запрос — считаем без кеша
+            cache = state[2] if state[0] == month_index.version else {}
+
+            day = start_date
+            while day <= end_date:
+                entries = days.get(day)
+                if entries:
+                    day_lines = cache.get((employee, day))
+                    if day_lines is None:
+                        day_lines = cache[(employee, day)] = render_day(day, entries)
+                    marker = TODAY_MARKER if day == today else ""
+                    result.extend(f"{line}{marker}\n" for line in day_lines)
+                day += timedelta(days=1)
+        return result
@@ -0,0 +1,155 @@
+import itertools
+import logging
+
+# Коды статусов в таблице shifts
+STATUS_CODES = {
+    'work': 1,
+    'dayoff': 2,
+    'vacation': 3,
+    'duty': 4
+}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+MINUTES_PER_DAY = 24 * 60
+
+# Размер пачки строк для executemany при записи смен
+WRITE_BATCH_SIZE = 5000
+
+TABLES = """
+CREATE TABLE IF NOT EXISTS employees (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS statuses (
+    code INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS shifts (
+    date TEXT NOT NULL,
+    employee_id INTEGER NOT NULL REFERENCES employees(id),
+    status INTEGER NOT NULL REFERENCES statuses(code),
+    start_min INTEGER,
+    end_min INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_shifts_date_start
+    ON shifts(date, start_min, end_min, employee_id, status);
+CREATE INDEX IF NOT EXISTS idx_shifts_employee_date
+    ON shifts(employee_id, date, start_min, end_min, status);
+"""
+
+
+def parse_interval(time_range):
+    """
+    Разбирает интервал вида 'HH:MM-HH:MM' в минуты от начала суток.
+
+    Ночная смена нормализуется: конец переносится на следующие сутки
+    (21:00-09:00 -> 1260, 1980), поэтому всегда start_min < end_min.
+
+    :return: (start_min, end_min) или (None, None), если интервал не распознан
+    """
+    try:
+        start, end = str(time_range).split('-')
+        start_h, start_m = start.strip().split(':')
+        end_h, end_m = end.strip().split(':')
+        start_min = int(start_h) * 60 + int(start_m)
+        end_min = int(end_h) * 60 + int(end_m)
+    except ValueError:
+        return None, None
+    if end_min <= start_min:
+        end_min += MINUTES_PER_DAY
+    return start_min, end_min
+
+
+def format_interval(start_min, end_min):
+    """Обратное преобразование минут в строку 'HH:MM-HH:MM'"""
+    if start_min is None or end_min is None:
+        return ''
+    start_min %= MINUTES_PER_DAY
+    end_min %= MINUTES_PER_DAY
+    return f"{start_min // 60:02d}:{start_min % 60:02d}-{end_min // 60:02d}:{end_min % 60:02d}"
+
+
+def batched(records, batch_size=WRITE_BATCH_SIZE):
+    """Разбивает поток записей на списки по batch_size"""
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class ShiftWriter:
+    """
+    Пересоздаёт нормализованные таблицы и записывает смены пачками.
+
+    Все пачки вставляются через executemany в одной транзакции, поэтому поток
+    записей не накапливается в памяти; индексы строятся в finish(), после
+    загрузки данных.
+    """
+
+    INSERT_SHIFTS = "INSERT INTO shifts (date, employee_id, status, start_min, end_min) VALUES (?, ?, ?, ?, ?)"
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.count = 0
+        self._employee_ids = {}
+        conn.executescript("""
+        DROP TABLE IF EXISTS shifts;
+        DROP TABLE IF EXISTS employees;
+        DROP TABLE IF EXISTS statuses;
+        """)
+        conn.executescript(TABLES)
+
+    def add(self, records):
+        """
+        :param records: список (ISO дата, сотрудник, код статуса, start_min, end_min)
+        """
+        employee_ids = self._employee_ids
+        self.conn.executemany(self.INSERT_SHIFTS, [
+            (date, employee_ids.setdefault(employee, len(employee_ids) + 1), code, start_min, end_min)
+            for date, employee, code, start_min, end_min in records
+        ])
+        self.count += len(records)
+
+    def finish(self):
+        """Записывает справочники, фиксирует транзакцию и строит индексы; возвращает количество смен"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO employees (id, username) VALUES (?, ?)",
+                [(employee_id, employee) for employee, employee_id in self._employee_ids.items()]
+            )
+            self.conn.executemany(
+                "INSERT INTO statuses (code, name) VALUES (?, ?)",
+                [(code, name) for name, code in STATUS_CODES.items()]
+            )
+        self.conn.executescript(INDEXES)
+        return self.count
+
+
+def report_unknown_statuses(unknown):
+    """
+    Сообщает о нераспознанных статусах, которые не попали в расписание.
+
+    :param unknown: словарь статус -> количество ячеек
+    """
+    if unknown:
+        details = ', '.join(f"'{status}' x{count}" for status, count in sorted(unknown.items(), key=lambda item: -item[1]))
+        logging.warning(f"Неизвестные статусы пропущены: {details}")
+
+
+def write_meta(conn, values):
+    """Сохраняет служебные значения (ETag, хеш содержимого и т.п.) в таблицу meta"""
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(key, value) for key, value in values.items() if value is not None]
+        )
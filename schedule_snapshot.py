@@ -0,0 +1,223 @@
+import mmap
+import os
+import shutil
+import struct
+import sys
+from array import array
+
+# Формат снимка: заголовок, имена сотрудников через '\n' и колонки одинаковой длины,
+# каждая выровнена на 8 байт. Числа в порядке little-endian
+MAGIC = b'DUTYSNAP'
+VERSION = 1
+_HEADER = struct.Struct('<8sIII')  # сигнатура, версия, количество смен, длина блока имён
+
+# Колонки: индекс сотрудника, день (date.toordinal()), минуты начала и конца, код статуса
+COLUMNS = (
+    ('employee', 'I'),
+    ('day', 'i'),
+    ('start_min', 'h'),
+    ('end_min', 'h'),
+    ('status', 'B'),
+)
+
+# Значение минут для нераспознанного интервала
+NO_MINUTES = -1
+
+_ALIGN = 8
+
+
+def snapshot_path(db_path):
+    """Снимок лежит рядом с базой: schedule.db -> schedule.snap"""
+    return os.path.splitext(db_path)[0] + '.snap'
+
+
+def _padding(offset):
+    return -offset % _ALIGN
+
+
+def _column_bytes(typecode, values):
+    data = array(typecode, values)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+
+class SnapshotWriter:
+    """
+    Пошаговая запись снимка с ограниченной памятью.
+
+    Смены одного дня копятся в памяти, упорядочиваются по (начало, конец),
+    как в выборке из SQLite, и дописываются в отдельный временный файл на
+    каждую колонку. finish() собирает из них снимок и атомарно подменяет
+    прежний (через временный файл и os.replace).
+
+    Дни обычно приходят по порядку (строки таблицы идут по датам). Если
+    таблица нарушает порядок, колонки при finish() читаются целиком и
+    сортируются в памяти.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self._employees = {}
+        self._day = None
+        self._pending = []
+        self._count = 0
+        self._ordered = True
+        self._files = {name: open(self._column_path(name), 'wb') for name, _ in COLUMNS}
+
+    def _column_path(self, name):
+        return f"{self.tmp_path}.{name}"
+
+    def add(self, employee, day, start_min, end_min, status):
+        """
+        :param day: date.toordinal() дня смены
+        :param start_min: минуты начала или None, если интервал не распознан
+        """
+        if day != self._day:
+            self._flush()
+            if self._day is not None and day < self._day:
+                self._ordered = False
+            self._day = day
+        index = self._employees.setdefault(employee, len(self._employees))
+        self._pending.append((
+            NO_MINUTES if start_min is None else start_min,
+            NO_MINUTES if end_min is None else end_min,
+            index,
+            status,
+        ))
+
+    def _flush(self):
+        if not self._pending:
+            return
+        self._pending.sort(key=lambda shift: (shift[0], shift[1]))
+        starts, ends, employees, statuses = zip(*self._pending)
+        values = {
+            'employee': employees,
+            'day': [self._day] * len(self._pending),
+            'start_min': starts,
+            'end_min': ends,
+            'status': statuses,
+        }
+        for name, typecode in COLUMNS:
+            self._files[name].write(_column_bytes(typecode, values[name]))
+        self._count += len(self._pending)
+        self._pending = []
+
+    def finish(self):
+        """Собирает снимок из временных колонок и подменяет им прежний"""
+        self._flush()
+        for f in self._files.values():
+            f.close()
+        names = '\n'.join(self._employees).encode('utf-8')
+        order = None if self._ordered else self._sorted_order()
+
+        with open(self.tmp_path, 'wb') as out:
+            out.write(_HEADER.pack(MAGIC, VERSION, self._count, len(names)))
+            out.write(names)
+            out.write(b'\0' * _padding(_HEADER.size + len(names)))
+            for name, typecode in COLUMNS:
+                size = struct.calcsize(typecode) * self._count
+                with open(self._column_path(name), 'rb') as column:
+                    if order is None:
+                        shutil.copyfileobj(column, out)
+                    else:
+                        data = self._read_column(column, typecode)
+                        out.write(_column_bytes(typecode, (data[i] for i in order)))
+                out.write(b'\0' * _padding(size))
+        self._remove_columns()
+        os.replace(self.tmp_path, self.path)
+
+    def _read_column(self, f, typecode):
+        data = array(typecode)
+        data.frombytes(f.read())
+        if sys.byteorder == 'big':
+            data.byteswap()
+        return data
+
+    def _sorted_order(self):
+        """Порядок смен по (день, начало, конец) для таблиц с датами не по порядку"""
+        keys = {}
+        for name in ('day', 'start_min', 'end_min'):
+            with open(self._column_path(name), 'rb') as f:
+                keys[name] = self._read_column(f, dict(COLUMNS)[name])
+        return sorted(range(self._count), key=lambda i: (keys['day'][i], keys['start_min'][i], keys['end_min'][i]))
+
+    def abort(self):
+        for f in self._files.values():
+            f.close()
+        self._remove_columns()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def _remove_columns(self):
+        for name, _ in COLUMNS:
+            if os.path.exists(self._column_path(name)):
+                os.remove(self._column_path(name))
+
+
+class Snapshot:
+    """
+    Снимок, отображённый в память: колонки читаются как memoryview без копирования.
+
+    Используется как контекстный менеджер; после закрытия колонки недоступны.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError("Снимок читается только на little-endian платформах")
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, count, names_size = _HEADER.unpack_from(self._mmap)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path}: неизвестный формат снимка")
+            offset = _HEADER.size
+            names = bytes(self._mmap[offset:offset + names_size]).decode('utf-8')
+            self.employees = names.split('\n') if names else []
+            offset += names_size + _padding(offset + names_size)
+
+            self._view = memoryview(self._mmap)
+            self.columns = {}
+            for name, typecode in COLUMNS:
+                size = struct.calcsize(typecode) * count
+                if offset + size > len(self._mmap):
+                    raise ValueError(f"{path}: снимок обрезан")
+                self.columns[name] = self._view[offset:offset + size].cast(typecode)
+                offset += size + _padding(size)
+            self.count = count
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return self.count
+
+    def rows(self):
+        """Смены по порядку: (день, start_min, end_min, код статуса, имя сотрудника)"""
+        employees = self.employees
+        columns = self.columns
+        for day, start_min, end_min, status, employee in zip(
+                columns['day'], columns['start_min'], columns['end_min'], columns['status'], columns['employee']):
+            yield (
+                day,
+                None if start_min == NO_MINUTES else start_min,
+                None if end_min == NO_MINUTES else end_min,
+                status,
+                employees[employee],
+            )
+
+    def close(self):
+        for column in getattr(self, 'columns', {}).values():
+            column.release()
+        self.columns = {}
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,133 @@
+import json
+import os
+import re
+from collections import namedtuple
+
+# Хранилище расписания: <корень>/<команда>/<ГГГГ-ММ>.db (+ снимок .snap) и manifest.json,
+# где записаны состояние таблиц (ETag, хеш содержимого) и владельцы разделов
+MANIFEST_NAME = 'manifest.json'
+
+# Имя команды становится каталогом хранилища
+_TEAM_PATTERN = re.compile(r'^[\w.-]+$')
+
+
+class ScheduleSource(namedtuple('ScheduleSource', ['team', 'location'])):
+    """Таблица расписания команды: URL (http/https) или путь к CSV-файлу"""
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return f"{self.team}:{self.location}"
+
+    @property
+    def is_url(self):
+        return self.location.startswith(('http://', 'https://'))
+
+
+def load_sources(value, default_url=None, default_team='default'):
+    """
+    Список таблиц из SCHEDULE_SOURCES.
+
+    Формат — JSON-список объектов {"team": "...", "url": "..."} или
+    {"team": "...", "path": "..."}. Если SCHEDULE_SOURCES не задан,
+    используется одна таблица default_url (CSV_URL).
+
+    :return: список ScheduleSource
+    """
+    if not value:
+        if not default_url:
+            raise ValueError("Не заданы ни SCHEDULE_SOURCES, ни CSV_URL")
+        return [ScheduleSource(default_team, default_url)]
+
+    sources = []
+    for item in json.loads(value):
+        team = item.get('team')
+        location = item.get('url') or item.get('path')
+        if not team or not _TEAM_PATTERN.match(team):
+            raise ValueError(f"Некорректное имя команды в SCHEDULE_SOURCES: {team!r}")
+        if not location:
+            raise ValueError(f"Для команды {team} не указан url или path")
+        sources.append(ScheduleSource(team, location))
+    if len({source.key for source in sources}) != len(sources):
+        raise ValueError("Таблицы в SCHEDULE_SOURCES повторяются")
+    return sources
+
+
+def month_of(iso_date):
+    """Раздел, к которому относится дата: 'YYYY-MM-DD' -> 'YYYY-MM'"""
+    return iso_date[:7]
+
+
+def partition_path(root, team, month):
+    return os.path.join(root, team, f"{month}.db")
+
+
+class ScheduleStore:
+    """
+    Расписание, разбитое на разделы по командам и месяцам.
+
+    Раздел — обычная база SQLite со снимком рядом, которая подменяется
+    атомарно. Манифест перезаписывается после разделов, поэтому его
+    отпечаток меняется при каждом обновлении хранилища.
+
+    Раздел принадлежит таблице, для которой этот месяц основной (месяц
+    первой даты таблицы). Дни следующего месяца в конце таблицы пишутся
+    в раздел, только пока у него нет основной таблицы.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+
+    def read_manifest(self):
+        """{'sources': {ключ таблицы: состояние}, 'partitions': {'команда/ГГГГ-ММ': владелец}}"""
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        manifest.setdefault('sources', {})
+        manifest.setdefault('partitions', {})
+        return manifest
+
+    def write_manifest(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def partitions(self, manifest=None):
+        """Разделы по порядку месяцев: список (команда, месяц, путь к базе)"""
+        manifest = manifest if manifest is not None else self.read_manifest()
+        result = []
+        for name in manifest['partitions']:
+            team, month = name.split('/')
+            result.append((team, month, partition_path(self.root, team, month)))
+        return sorted(result, key=lambda partition: (partition[1], partition[0]))
+
+    def signature(self):
+        """Отпечаток манифеста: меняется при каждом обновлении хранилища"""
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    @staticmethod
+    def may_write(manifest, source, month, primary):
+        """
+        Можно ли таблице source записать раздел month.
+
+        :param primary: месяц для таблицы основной
+        """
+        owner = manifest['partitions'].get(f"{source.team}/{month}")
+        return primary or owner is None or owner.get('spill', False)
+
+    @staticmethod
+    def claim(manifest, source, month, primary, updated_at):
+        manifest['partitions'][f"{source.team}/{month}"] = {
+            'source': source.key,
+            'spill': not primary,
+            'updated_at': updated_at,
+        }
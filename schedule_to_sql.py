@@ -1,103 +1,610 @@
-import pandas as pd
+import csv
+import hashlib
+import logging
+import pickle
 import sqlite3
-import requests
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime
 import dotenv
 from dotenv import load_dotenv
 import os
 import json
+from metrics import INGEST_RUNS, INGEST_STAGE_DURATION, SCHEDULE_COLUMNS, SCHEDULE_ROWS
+from schedule_parser import (STREAM_CHUNK_SIZE, SnapshotSink, SqliteSink, abort_sinks, commit_sinks, create_session,
+                             fetch_csv, iter_csv_records, iter_text_lines, observe_parse_stages, parse_sheet,
+                             run_pipeline)
+from schedule_schema import STATUS_CODES, batched, parse_interval, report_unknown_statuses
+from schedule_snapshot import snapshot_path
+from schedule_store import ScheduleSource, ScheduleStore, month_of, partition_path
 
 load_dotenv()
 head_mapping = json.loads(os.getenv('HEAD_MAPPING'))
 
+# Хранилище таблиц нескольких команд, разбитое по командам и месяцам
+STORE_DIR = './schedule_store'
 
-def download_and_process_schedule(csv_url):
+# Процессы для разбора и записи таблиц разных команд (0 — по числу ядер)
+INGEST_PROCESSES = int(os.getenv('INGEST_PROCESSES', '0')) or os.cpu_count() or 1
 
-    if not csv_url:
-        print("URL не найден в .env файле!")
-        exit()
+# Потоковая загрузка: таблица читается кусками и пишется в разделы пачками, без копий в памяти
+STREAMING_INGEST = os.getenv('INGEST_STREAMING', '').lower() in ('1', 'true', 'yes')
 
-    # Скачиваем CSV файл
-    response = requests.get(csv_url)
+# Бинарный снимок рядом с базой, который бот отображает в память при старте
+WRITE_SNAPSHOT = os.getenv('SCHEDULE_SNAPSHOT', '1').lower() in ('1', 'true', 'yes')
 
-    # Проверяем успешность запроса
-    if response.status_code == 200:
-        # Сохраняем файл
-        with open('schedule.csv', 'wb') as f:
-            f.write(response.content)
-        print("CSV файл успешно скачан и сохранен как 'schedule.csv'.")
+
+def create_sinks(db_name):
+    """
+    Приёмники загрузки: база SQLite и, если включено, бинарный снимок.
+
+    База фиксируется первой, поэтому снимок новее базы, только если собран из тех же данных.
+    """
+    directory = os.path.dirname(db_name)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    sinks = [SqliteSink(db_name)]
+    if WRITE_SNAPSHOT:
+        sinks.append(SnapshotSink(snapshot_path(db_name)))
+    return sinks
+
+
+def migrate_legacy_db(db_path, store_dir, team):
+    """
+    Переносит расписание из базы прежних версий в разделы команды team.
+
+    Прежний формат — широкая таблица schedule: дата DD.MM.YYYY в первой
+    колонке, интервал во второй и колонка на сотрудника со статусом.
+    Перенос выполняется только в пустое хранилище. Разделы записываются
+    как дополнительные (см. ScheduleStore.may_write), поэтому первая же
+    загрузка таблиц перезаписывает свои месяцы, а остальные остаются историей.
+
+    :return: пути к базам записанных разделов (пусто, если переносить нечего)
+    """
+    store = ScheduleStore(store_dir)
+    manifest = store.read_manifest()
+    if manifest['partitions'] or not os.path.exists(db_path):
+        return []
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'schedule' not in tables:
+            return []
+        cursor = conn.execute("SELECT * FROM schedule")
+        employees = [column[0] for column in cursor.description][2:]
+        by_month = {}
+        unknown = {}
+        for row in cursor:
+            if not row[0]:
+                continue
+            day = datetime.strptime(row[0], '%d.%m.%Y').date().isoformat()
+            start_min, end_min = parse_interval(row[1])
+            for employee, status in zip(employees, row[2:]):
+                if status is None:
+                    continue
+                if status not in STATUS_CODES:
+                    unknown[status] = unknown.get(status, 0) + 1
+                    continue
+                by_month.setdefault(month_of(day), []).append((day, employee, STATUS_CODES[status], start_min, end_min))
+    finally:
+        conn.close()
+    report_unknown_statuses(unknown)
+
+    source = ScheduleSource(team, db_path)
+    updated_at = datetime.now().isoformat(timespec='seconds')
+    written = []
+    for month, records in sorted(by_month.items()):
+        db_name = partition_path(store.root, team, month)
+        sinks = create_sinks(db_name)
+        run_pipeline(records, sinks)
+        commit_sinks(sinks, {'source': source.key, 'updated_at': updated_at})
+        store.claim(manifest, source, month, False, updated_at)
+        written.append(db_name)
+    if written:
+        store.write_manifest(manifest)
+    return written
+
+
+def download_and_process_sources(sources, store_dir=STORE_DIR, processes=None, streaming=None):
+    """
+    Загружает таблицы нескольких команд и обновляет затронутые разделы хранилища.
+
+    Таблицы скачиваются параллельно через общую сессию с keep-alive и
+    повторами. Ошибка одной таблицы не мешает остальным, исключение
+    возникает, только если ничего не обновилось.
+
+    В обычном режиме таблица скачивается целиком, а разбор и запись
+    разделов (вместе с отпечатками, сравнением и снимками — основная часть
+    работы) идут в отдельном процессе на команду, до INGEST_PROCESSES
+    одновременно. При достаточном числе ядер обновление занимает примерно
+    столько же, сколько самая долгая команда; таблицы одной команды пишут
+    общие разделы и обрабатываются по очереди. В потоковом режиме
+    (INGEST_STREAMING) таблица разбирается по мере чтения ответа и сразу
+    пишется в разделы, поэтому память не зависит от размера таблицы.
+
+    :param sources: список ScheduleSource
+    :param processes: процессов для разбора (по умолчанию INGEST_PROCESSES)
+    :param streaming: потоковый режим (по умолчанию из INGEST_STREAMING)
+    :return: пути к базам обновлённых разделов
+    """
+    if streaming is None:
+        streaming = STREAMING_INGEST
+    store = ScheduleStore(store_dir)
+    manifest = store.read_manifest()
+
+    with INGEST_STAGE_DURATION.time(stage='sources'):
+        if streaming:
+            outcomes = _stream_sources(store, manifest, sources)
+        else:
+            outcomes = _load_sources(store, manifest, sources, processes or INGEST_PROCESSES)
+
+    updated = []
+    errors = []
+    manifest_changed = False
+    for source in sources:
+        result, state, detail = outcomes[source]
+        if result == 'error':
+            INGEST_RUNS.inc(result='error')
+            logging.warning(f"{source.team}: ошибка загрузки {source.location}: {detail}")
+            errors.append((source, detail))
+            continue
+        INGEST_RUNS.inc(result=result)
+        if result == 'updated':
+            updated.extend(db_path for db_path in detail if db_path not in updated)
+        else:
+            logging.info(f"{source.team}: таблица не изменилась, обновление не требуется.")
+        if state != manifest['sources'].get(source.key):
+            manifest['sources'][source.key] = state
+            manifest_changed = True
+
+    if manifest_changed or updated:
+        store.write_manifest(manifest)
+    _report_sheet_sizes(manifest, sources)
+
+    # Если что-то обновилось, бот должен подхватить изменения, поэтому ошибки только пишутся в лог
+    if errors and not updated:
+        source, error = errors[0]
+        raise RuntimeError(f"{source.team}: {error}")
+    return updated
+
+
+def _load_sources(store, manifest, sources, processes):
+    """
+    Обычный режим: параллельная загрузка, затем разбор и запись разделов
+    каждой команды в своём процессе, как только загружены все её таблицы.
+
+    :return: {источник: (результат, состояние, пути к разделам или ошибка)}
+    """
+    teams = {}
+    for source in sources:
+        teams.setdefault(source.team, []).append(source)
+
+    outcomes = {}
+    fetched = {}
+    with create_session(len(sources)) as session, \
+            ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix='ingest-fetch') as fetchers:
+        fetches = {
+            fetchers.submit(_fetch_source, session, source, manifest['sources'].get(source.key, {})): source
+            for source in sources
+        }
+        workers = _IngestWorkers(min(processes, len(teams)))
+        try:
+            jobs = {}
+            for future in as_completed(fetches):
+                source = fetches[future]
+                try:
+                    result, content, state = future.result()
+                except Exception as e:
+                    outcomes[source] = ('error', None, e)
+                else:
+                    if result == 'fetched':
+                        fetched[source] = (content, state)
+                    else:
+                        outcomes[source] = (result, state, None)
+
+                team = teams[source.team]
+                if any(other not in outcomes and other not in fetched for other in team):
+                    continue
+                sheets = [(other,) + fetched.pop(other) for other in team if other in fetched]
+                if sheets:
+                    jobs[workers.submit(store.root, _team_partitions(manifest, source.team), sheets)] = sheets
+
+            for future in as_completed(jobs):
+                sheets = jobs[future]
+                try:
+                    results, partitions = future.result()
+                except Exception as e:
+                    for source, _, _ in sheets:
+                        outcomes[source] = ('error', None, e)
+                    continue
+                team = sheets[0][0].team
+                manifest['partitions'] = {name: owner for name, owner in manifest['partitions'].items()
+                                          if not name.startswith(f"{team}/")}
+                manifest['partitions'].update(partitions)
+                for (source, _, _), outcome in zip(sheets, results):
+                    outcomes[source] = outcome
+        finally:
+            workers.shutdown()
+    return outcomes
+
+
+def _team_partitions(manifest, team):
+    """Владельцы разделов одной команды из манифеста"""
+    return {name: owner for name, owner in manifest['partitions'].items() if name.startswith(f"{team}/")}
+
+
+def ingest_team(root, partitions, sheets):
+    """
+    Разбирает таблицы одной команды и пересобирает разделы, которые им разрешено писать.
+
+    Выполняется в процессе загрузки (см. _IngestWorkers). Разделы разных
+    команд не пересекаются, поэтому функция получает только владельцев
+    разделов своей команды и возвращает их обновлённую копию; таблицы
+    команды пишутся по порядку sources.
+
+    :param root: корень хранилища
+    :param partitions: владельцы разделов команды, см. _team_partitions
+    :param sheets: список (таблица, содержимое, состояние) в порядке sources
+    :return: (список (результат, состояние, пути к разделам или текст ошибки), владельцы разделов команды)
+    """
+    store = ScheduleStore(root)
+    manifest = {'sources': {}, 'partitions': dict(partitions)}
+    lock = threading.Lock()
+    outcomes = []
+    for source, content, state in sheets:
+        writer = _SourceWriter(store, manifest, source, lock)
+        try:
+            records, stats = parse_sheet(content, head_mapping)
+            observe_parse_stages(stats)
+            _record_stats(state, stats)
+            with INGEST_STAGE_DURATION.time(stage='write'):
+                writer.write(records)
+                outcomes.append(('updated', state, writer.commit(state)))
+        except Exception as e:
+            writer.abort()
+            outcomes.append(('error', None, str(e)))
+    return outcomes, manifest['partitions']
+
+
+def _stream_sources(store, manifest, sources):
+    """
+    Потоковый режим: каждая таблица разбирается и пишется в своём потоке загрузки.
+
+    Таблицы одной команды могут писать в одни и те же разделы, поэтому они
+    обрабатываются по очереди; таблицы разных команд — параллельно.
+
+    :return: {источник: (результат, состояние, пути к разделам или ошибка)}
+    """
+    team_locks = {source.team: threading.Lock() for source in sources}
+    lock = threading.Lock()
+    outcomes = {}
+    with create_session(len(sources)) as session, \
+            ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix='ingest-stream') as streams:
+        futures = {
+            streams.submit(_stream_source, session, store, manifest, source,
+                           manifest['sources'].get(source.key, {}), team_locks[source.team], lock): source
+            for source in sources
+        }
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                outcomes[source] = future.result()
+            except Exception as e:
+                outcomes[source] = ('error', None, e)
+    return outcomes
+
+
+@contextmanager
+def _open_source(session, source, state, stream):
+    """
+    Открывает таблицу с условным запросом по сохранённому состоянию.
+
+    Для файла роль Last-Modified играет время изменения. ETag и
+    Last-Modified ответа записываются в state.
+
+    :return: итератор кусков содержимого или None, если таблица не изменилась
+    """
+    if source.is_url:
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+        with fetch_csv(source.location, headers, stream=stream, session=session) as response:
+            if response.status_code == 304:
+                yield None
+                return
+            if response.status_code != 200:
+                raise RuntimeError(f"Ошибка при скачивании файла: {response.status_code}")
+            state['etag'] = response.headers.get('ETag')
+            state['last_modified'] = response.headers.get('Last-Modified')
+            yield response.iter_content(STREAM_CHUNK_SIZE)
     else:
-        print(f"Ошибка при скачивании файла: {response.status_code}")
-        exit()
-
-    # Загружаем CSV-файл
-    file_path = './schedule.csv'
-    df = pd.read_csv(file_path)
-
-    # Обрезаем колонки после последней, которая не является пустой
-    columns_to_keep = [col for col in df.columns if 'Unnamed' not in col]
-    df_filtered = df[columns_to_keep].copy()  # Создаём копию данных
-
-    # Находим последнюю дату и удаляем строки после неё
-    date_rows = df_filtered['Дата'].dropna()
-    last_date_index = date_rows.last_valid_index()
-    df_filtered = df_filtered.loc[:last_date_index]
-
-    # Заполняем пропуски в столбце 'Дата' значениями из предыдущей строки
-    df_filtered['Дата'] = df_filtered['Дата'].ffill()
-
-    # Преобразуем даты в формат YYYY-MM-DD
-    df_filtered['Дата'] = df_filtered['Дата'].apply(get_date)
-
-    status_mapping = {
-        'р': 'work',
-        'о': 'vacation',
-        '+': 'duty',
-        'в': 'dayoff'
-    }
-
-    # Переименовываем столбцы на английский
-    df_filtered.rename(columns=head_mapping, inplace=True)
-
-    # Применяем замену статусов
-    for col in df_filtered.columns[2:]:  # Начинаем с третьей колонки, где начинаются имена сотрудников
-        df_filtered[col] = df_filtered[col].replace(status_mapping)  # Заменяем статусы с помощью replace
-
-    # Создаём базу данных SQLite и записываем таблицу
-    db_name = './schedule.db'
-    table_name = 'schedule'
-
-    conn = sqlite3.connect(db_name)
-    df_filtered.to_sql(table_name, conn, if_exists='replace', index=False)
-    conn.close()
-
-    print("Данные успешно сохранены в базе данных.")
-
-
-def get_date(rus_date):
-    parts = rus_date.split(', ')
-    day = parts[1].split(' ')[0]
-    month_cyr = parts[1].split(' ')[1][:3]  # Учитываем только первые 3 символа
-
-    month_mapping = {
-        'янв': '01',
-        'фев': '02',
-        'мар': '03',
-        'апр': '04',
-        'май': '05',
-        'июн': '06',
-        'июл': '07',
-        'авг': '08',
-        'сен': '09',
-        'окт': '10',
-        'ноя': '11',
-        'дек': '12'
-    }
-    month = month_mapping.get(month_cyr)
-    if not month:
-        raise ValueError(f"Unknown month abbreviation: {month_cyr}")
-
-
-    year = datetime.now().strftime('%Y')
-    return f"{day.zfill(2)}.{month}.{year}"
+        mtime = str(os.stat(source.location).st_mtime_ns)
+        if mtime == state.get('last_modified'):
+            yield None
+            return
+        with open(source.location, 'rb') as f:
+            state['last_modified'] = mtime
+            yield iter(lambda: f.read(STREAM_CHUNK_SIZE), b'')
+
+
+def _fetch_source(session, source, state):
+    """
+    Загружает одну таблицу целиком.
+
+    :return: ('not_modified' | 'unchanged' | 'fetched', содержимое или None, новое состояние таблицы)
+    """
+    state = dict(state, team=source.team, location=source.location)
+    with INGEST_STAGE_DURATION.time(stage='download'):
+        with _open_source(session, source, state, stream=False) as chunks:
+            if chunks is None:
+                return 'not_modified', None, state
+            content = b''.join(chunks)
+
+    content_hash = hashlib.sha256(content).hexdigest()
+    if content_hash == state.get('content_hash'):
+        return 'unchanged', None, state
+    state['content_hash'] = content_hash
+    return 'fetched', content, state
+
+
+def _stream_source(session, store, manifest, source, state, team_lock, lock):
+    """
+    Потоковая загрузка одной таблицы: ответ читается кусками, строки проходят
+    через генераторы и пишутся в разделы пачками, без временного CSV.
+
+    Хеш содержимого известен только после чтения всего ответа, поэтому при
+    совпадении хеша собранные временные разделы просто удаляются.
+
+    :return: (результат, состояние, пути к разделам)
+    """
+    state = dict(state, team=source.team, location=source.location)
+    with team_lock, INGEST_STAGE_DURATION.time(stage='stream'):
+        with _open_source(session, source, state, stream=True) as chunks:
+            if chunks is None:
+                return 'not_modified', state, None
+            hasher = hashlib.sha256()
+            stats = {}
+            writer = _SourceWriter(store, manifest, source, lock)
+            try:
+                writer.write(iter_csv_records(csv.reader(iter_text_lines(chunks, hasher)), head_mapping, stats))
+                content_hash = hasher.hexdigest()
+                if content_hash == state.get('content_hash'):
+                    writer.abort()
+                    return 'unchanged', state, None
+                state['content_hash'] = content_hash
+                _record_stats(state, stats)
+                return 'updated', state, writer.commit(state)
+            except Exception:
+                writer.abort()
+                raise
+
+
+def _record_stats(state, stats):
+    report_unknown_statuses(stats['unknown'])
+    state['rows'] = stats['rows']
+    state['columns'] = stats['columns']
+
+
+def _report_sheet_sizes(manifest, sources):
+    """Размер таблиц по командам, включая таблицы, которые в этот раз не менялись"""
+    rows, columns = {}, {}
+    for source in sources:
+        state = manifest['sources'].get(source.key, {})
+        if 'rows' not in state:
+            continue
+        rows[source.team] = rows.get(source.team, 0) + state['rows']
+        columns[source.team] = max(columns.get(source.team, 0), state['columns'])
+    for team in rows:
+        SCHEDULE_ROWS.set(rows[team], team=team)
+        SCHEDULE_COLUMNS.set(columns[team], team=team)
+
+
+class _IngestWorkers:
+    """
+    Разбор и запись таблиц команд в отдельных процессах; процессы запускаются при первом задании.
+
+    Исполнитель — новый интерпретатор (python schedule_to_sql.py), который
+    импортирует только модули загрузки. fork процесса бота, где уже работают
+    потоки (HTTP-сервер, рассылка, напоминания, логирование), может оставить
+    в потомке захваченные блокировки, а spawn из multiprocessing заново
+    выполнил бы в каждом процессе весь bot.py. Задания и результаты
+    передаются через pickle по stdin/stdout: туда — содержимое таблиц,
+    обратно — итоги записи, журнал и длительности этапов исполнителя. Для
+    одного процесса задания выполняются по очереди в отдельном потоке.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._executor = ThreadPoolExecutor(max_workers=max(processes, 1), thread_name_prefix='ingest-write')
+        self._local = threading.local()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def submit(self, root, partitions, sheets):
+        """Задание ingest_team; результат — future с тем, что вернула ingest_team"""
+        if self.processes <= 1:
+            return self._executor.submit(ingest_team, root, partitions, sheets)
+        return self._executor.submit(self._run_in_worker, (root, partitions, sheets))
+
+    def _worker(self):
+        """Процесс-исполнитель текущего потока пула"""
+        worker = getattr(self._local, 'worker', None)
+        if worker is None:
+            worker = subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self._local.worker = worker
+            with self._lock:
+                self._workers.append(worker)
+        return worker
+
+    def _run_in_worker(self, job):
+        worker = self._worker()
+        try:
+            pickle.dump((logging.getLogger().getEffectiveLevel(), job), worker.stdin,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+            worker.stdin.flush()
+            ok, result, records, stages = pickle.load(worker.stdout)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            # Исполнитель упал; следующее задание этого потока запустит новый
+            self._local.worker = None
+            worker.kill()
+            raise RuntimeError(f"Процесс загрузки завершился с ошибкой: {e}") from None
+        INGEST_STAGE_DURATION.merge(stages)
+        for record in records:
+            logger = logging.getLogger(record.name)
+            if logger.isEnabledFor(record.levelno):
+                logger.handle(record)
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown()
+        for worker in self._workers:
+            try:
+                worker.stdin.close()
+            except OSError:
+                pass
+            worker.wait()
+            worker.stdout.close()
+
+
+class _LogBuffer(logging.Handler):
+    """Копит записи журнала процесса загрузки, чтобы отправить их боту вместе с ответом"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        # Аргументы и исключение могут не пройти через pickle, поэтому передаётся готовый текст
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+    def take(self):
+        records, self.records = self.records, []
+        return records
+
+
+class _SourceWriter:
+    """
+    Раскладывает записи одной таблицы по месяцам в разделы хранилища.
+
+    Раздел открывается при первой записи своего месяца, поэтому записи
+    можно подавать потоком. Основной месяц таблицы — месяц её первой даты;
+    дни месяца, у которого есть другая основная таблица, пропускаются.
+
+    :param lock: блокировка манифеста, общая для всех таблиц загрузки
+    """
+
+    def __init__(self, store, manifest, source, lock):
+        self.store = store
+        self.manifest = manifest
+        self.source = source
+        self.lock = lock
+        self._primary = None
+        self._sinks = {}  # месяц -> приёмники раздела или None, если месяц пропущен
+        self._months = set()
+
+    def write(self, records):
+        for batch in batched(records):
+            by_month = {}
+            for record in batch:
+                by_month.setdefault(month_of(record[0]), []).append(record)
+            for month, month_records in by_month.items():
+                for sink in self._month_sinks(month):
+                    sink.write(month_records)
+
+    def _month_sinks(self, month):
+        if month in self._sinks:
+            return self._sinks[month] or []
+        if self._primary is None:
+            self._primary = month
+        self._months.add(month)
+        with self.lock:
+            allowed = self.store.may_write(self.manifest, self.source, month, month == self._primary)
+        if not allowed:
+            logging.warning(f"{self.source.team}: дни {month} пропущены, у раздела есть основная таблица")
+            self._sinks[month] = None
+            return []
+        sinks = create_sinks(partition_path(self.store.root, self.source.team, month))
+        self._sinks[month] = sinks
+        for sink in sinks:
+            sink.open()
+        return sinks
+
+    def commit(self, state):
+        """
+        Фиксирует разделы и записывает их владельца в манифест.
+
+        :return: пути к базам записанных разделов
+        """
+        updated_at = datetime.now().isoformat(timespec='seconds')
+        meta = {
+            'source': self.source.key,
+            'etag': state.get('etag'),
+            'last_modified': state.get('last_modified'),
+            'content_hash': state.get('content_hash'),
+            'updated_at': updated_at,
+        }
+        written = []
+        for month in sorted(self._sinks):
+            sinks = self._sinks.pop(month)
+            if sinks is None:
+                continue
+            logging.info(f"{self.source.team}: раздел {month}")
+            commit_sinks(sinks, meta)
+            with self.lock:
+                self.store.claim(self.manifest, self.source, month, month == self._primary, updated_at)
+            written.append(partition_path(self.store.root, self.source.team, month))
+
+        state['months'] = sorted(self._months)
+        state['updated_at'] = updated_at
+        return written
+
+    def abort(self):
+        for sinks in self._sinks.values():
+            if sinks is not None:
+                abort_sinks(sinks)
+        self._sinks = {}
+
+
+def serve_ingest_requests(requests_in, results_out):
+    """
+    Цикл процесса загрузки: читает из requests_in задания (уровень журнала,
+    аргументы ingest_team) и пишет в results_out (успех, результат или текст
+    ошибки, записи журнала, длительности этапов). Завершается, когда
+    requests_in закрыт.
+    """
+    log_buffer = _LogBuffer()
+    logging.getLogger().addHandler(log_buffer)
+    while True:
+        try:
+            level, job = pickle.load(requests_in)
+        except EOFError:
+            return
+        logging.getLogger().setLevel(level)
+        try:
+            response = (True, ingest_team(*job))
+        except Exception as e:
+            response = (False, f"{type(e).__name__}: {e}")
+        pickle.dump(response + (log_buffer.take(), INGEST_STAGE_DURATION.drain()), results_out,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        results_out.flush()
+
 
+if __name__ == '__main__':
+    # Процесс загрузки для _IngestWorkers: stdout занят ответами, поэтому случайный вывод уходит в stderr
+    results = sys.stdout.buffer
+    sys.stdout = sys.stderr
+    serve_ingest_requests(sys.stdin.buffer, results)
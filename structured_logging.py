@@ -0,0 +1,140 @@
+import atexit
+import copy
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+# Поля записи, которые добавляются к JSON, если заданы через extra или log_context
+CONTEXT_FIELDS = ('handler', 'user', 'user_id', 'latency_ms', 'outcome')
+
+_context = threading.local()
+
+
+def current_context():
+    """Поля контекста текущего потока; обработчик может дополнять их по ходу работы"""
+    fields = getattr(_context, 'fields', None)
+    if fields is None:
+        fields = _context.fields = {}
+    return fields
+
+
+@contextmanager
+def log_context(**fields):
+    """Добавляет поля ко всем записям, сделанным в этом потоке внутри блока with"""
+    previous = getattr(_context, 'fields', None)
+    _context.fields = dict(previous or {}, **fields)
+    try:
+        yield _context.fields
+    finally:
+        _context.fields = previous
+
+
+class _ContextFilter(logging.Filter):
+    """Переносит поля контекста в запись; работает в потоке, который пишет в лог"""
+
+    def filter(self, record):
+        for name, value in current_context().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        exc = getattr(record, 'exc', None) or (self.formatException(record.exc_info) if record.exc_info else None)
+        if exc:
+            entry['exc'] = exc
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Сообщение и трассировка форматируются в пишущем потоке,
+        # в очередь уходит копия записи без ссылок на кадры стека
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+
+class CompressingTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """
+    Ротация файла лога в полночь со сжатием gzip.
+
+    Архивы называются bot.log.YYYY-MM-DD.gz; хранятся последние retention_days.
+    """
+
+    def __init__(self, filename, retention_days=30):
+        super().__init__(filename, when='midnight', backupCount=retention_days, encoding='utf-8', delay=True)
+        self.namer = lambda name: name + '.gz'
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def getFilesToDelete(self):
+        archives = sorted(glob.glob(glob.escape(self.baseFilename) + '.*.gz'))
+        if len(archives) <= self.backupCount:
+            return []
+        return archives[:len(archives) - self.backupCount]
+
+
+def setup_logging(log_dir, retention_days=30, level=logging.INFO):
+    """
+    Настраивает неблокирующее логирование в JSON.
+
+    Потоки бота только кладут записи в очередь; запись в файл, ротацию и
+    сжатие выполняет фоновый QueueListener.
+
+    :param log_dir: каталог логов, текущий файл — bot.log
+    :param retention_days: сколько сжатых архивов хранить
+    :param level: уровень логирования
+    :return: запущенный QueueListener
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    file_handler = CompressingTimedRotatingFileHandler(os.path.join(log_dir, 'bot.log'), retention_days)
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    # Дописываем очередь при завершении процесса
+    atexit.register(listener.stop)
+    return listener